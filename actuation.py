@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+
+
+class ActuationDispatcher:
+    """
+    Despacha as detecções para os atuadores (EV3, Arduino) em segundo plano,
+    para o laço da câmera nunca ficar parado esperando Bluetooth ou serial.
+
+    submit() só coloca o evento numa fila e volta na hora. Uma thread aplica
+    as regras de cooldown e de duplicatas e repassa o evento para cada saída;
+    cada saída tem a sua própria thread e fila, então um Arduino lento não
+    atrasa o envio ao EV3 (e vice-versa).
+
+    outputs é um dict nome -> função(label); cooldown é o tempo mínimo em
+    segundos entre dois disparos quaisquer e dedup_window o tempo, contado a
+    partir do último disparo de um label, em que novas detecções dele são
+    ignoradas (detecções ignoradas não renovam a janela).
+    """
+
+    def __init__(self, outputs, cooldown=0.0, dedup_window=0.0, queue_size=8):
+        self.cooldown = cooldown
+        self.dedup_window = dedup_window
+        self.events = queue.Queue(maxsize=queue_size)
+        self.outputs = {
+            name: (func, queue.Queue(maxsize=queue_size))
+            for name, func in outputs.items()
+        }
+        self.threads = []
+
+        self.last_fired = None
+        self.last_fired_label = {}
+
+        self.stats_lock = threading.Lock()
+        self.counters = {
+            'submitted': 0,
+            'fired': 0,
+            'cooldown': 0,
+            'duplicate': 0,
+            'dropped': 0,
+            'errors': 0,
+        }
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.counters[key] += 1
+
+    def start(self):
+        self.threads = [threading.Thread(target=self._dispatch_thread, daemon=True)]
+        for name, (func, outbox) in self.outputs.items():
+            self.threads.append(threading.Thread(
+                target=self._output_thread, args=(name, func, outbox), daemon=True
+            ))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Para as threads depois de terminar o que já estava na fila. Por
+        padrão espera todas as saídas terminarem, para ninguém fechar a porta
+        ou a conexão de um atuador que ainda está sendo usado; um envio
+        demorado (a confirmação da garra) tem que ser cancelado antes, no
+        próprio atuador.
+        """
+        self._put(self.events, None)
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+
+    def submit(self, label):
+        """
+        Entrega uma detecção sem bloquear. Devolve False se a fila estiver cheia.
+        """
+        self._count('submitted')
+        try:
+            self.events.put_nowait((label, time.time()))
+            return True
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+    def stats(self):
+        with self.stats_lock:
+            return dict(self.counters)
+
+    def _put(self, outbox, item):
+        try:
+            outbox.put_nowait(item)
+        except queue.Full:
+            if item is not None:
+                self._count('dropped')
+                return
+            # O aviso de parada sempre entra: descarta o item mais antigo
+            try:
+                outbox.get_nowait()
+            except queue.Empty:
+                pass
+            outbox.put_nowait(item)
+
+    def _dispatch_thread(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                break
+            label, when = event
+
+            last = self.last_fired_label.get(label)
+            if last is not None and when - last < self.dedup_window:
+                self._count('duplicate')
+                continue
+            if self.last_fired is not None and when - self.last_fired < self.cooldown:
+                self._count('cooldown')
+                continue
+
+            self.last_fired = when
+            self.last_fired_label[label] = when
+            self._count('fired')
+            for func, outbox in self.outputs.values():
+                self._put(outbox, label)
+
+        for func, outbox in self.outputs.values():
+            self._put(outbox, None)
+
+    def _output_thread(self, name, func, outbox):
+        while True:
+            label = outbox.get()
+            if label is None:
+                break
+            try:
+                func(label)
+            except Exception as e:
+                self._count('errors')
+                print(f"[ERRO] Atuador '{name}' falhou para '{label}': {e}")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark of the EV3Mailbox codec against the original
+# format-string implementation, using the ev3mailbox TEST_VECTORS.
+#
+# Usage: python3 benchmarks/bench_codec.py [iterations]
+
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ev3mailbox import EV3Mailbox, TEST_VECTORS
+
+class LegacyEV3Mailbox:
+    """
+    The original codec, built from per-call format strings. Copied verbatim
+    and kept here only as the reference for output equality and speed.
+    """
+
+    headerBytes = EV3Mailbox.headerBytes
+
+    @staticmethod
+    def decode(payload, d_type=None):
+        """
+        Decode a Mailbox message to its name and value.
+
+        Attempt to determine the type from the length of the contents, unless an
+        explicit type (d_type) was given.
+        """
+
+        # Shortest message is a boolean:
+        # HHHH L N 0 LL B = 10 bytes
+        mailboxSize = (struct.unpack_from('<H', payload, 0))[0]
+        if mailboxSize < 10:
+            raise BufferError(
+                'Payload is too small: {} < 10'.format(mailboxSize)
+            )
+
+        # Check that we have a Mailbox message header
+        header = (struct.unpack_from('<4s', payload, 2))[0]
+        if header != LegacyEV3Mailbox.headerBytes:
+            raise BufferError('Not a Mailbox message {} != {}'.format(
+                header, LegacyEV3Mailbox.headerBytes
+            ))
+
+        # Get the name and its length
+        nameLen    = (struct.unpack_from('<B', payload, 6))[0] - 1
+        name, null =  struct.unpack_from('<{}sB'.format(nameLen), payload, 7)
+
+        if null != 0:
+            raise BufferError('Name not NULL terminated')
+
+        name = name.decode('latin-1')
+
+        # Get the value and its length
+        valueLen = (struct.unpack_from('<H', payload, 8 + nameLen))[0]
+
+        if 8 + nameLen + valueLen != mailboxSize:
+            raise BufferError(
+              'Mailbox size error: Actual={} != Expected={}'.format(
+                  mailboxSize, 8 + nameLen + valueLen
+              )
+            )
+
+        valueBytes = (struct.unpack_from(
+            '<{}s'.format(valueLen), payload, 10 + nameLen
+        ))[0]
+
+        if d_type == None:
+            # Attempt to work out the type. Assume text to start.
+            d_type = str
+
+            if len(valueBytes) == 1:
+                d_type = bool
+
+            # A 3 char string is indistinguishable from a float in terms of
+            # length. A string will end in a \x00 but so can certain floats.
+            # Assume it's a number if the last byte is not a 0 or there is
+            # another zero in the bytes - e.g. Number 0 = \x00\x00\x00\x00.
+
+            if (len(valueBytes) == 4 and
+                (valueBytes[-1] != 0 or 0 in valueBytes[0:3])):
+                d_type  = float
+
+        # Double check the type as it may have been supplied.
+        if d_type not in (bool, int, float, str):
+            raise TypeError('Unknown type {}'.format(d_type))
+
+        if d_type == bool:
+            if len(valueBytes) != 1:
+                raise TypeError('Wrong size for a boolean')
+
+            value = True if (struct.unpack('B', valueBytes))[0] else False
+
+        if d_type in (int, float):
+            if len(valueBytes) != 4:
+                raise TypeError('Wrong size for a number')
+
+            value = (struct.unpack('f', valueBytes))[0]
+
+        if d_type == str:
+            if valueBytes[-1] != 0:
+                raise BufferError('Text value not NULL terminated')
+                
+            value = valueBytes[:-1].decode('latin-1')
+
+        return name, value, d_type
+
+    @staticmethod
+    def encode(name, value, d_type=None):
+        """
+        Create a mailbox based on a name, value and type (d_type).
+
+        Encode the message based on those parameters.
+        """
+
+        # Attempt to define the d_type based on the instance type of the value
+        # or coerce it based on the supplied type
+        if d_type == None:
+            d_type = type(value)
+
+        if d_type not in (bool, int, float, str):
+            raise TypeError('Unable to handle type {}'.format(d_type))
+        else:
+            s_type = type(value)
+            try:
+                value = d_type(value)
+            except:
+                raise TypeError('Unable to coerce type {} to {}'.format(s_type,d_type))
+
+        nameBytes = (name + '\x00').encode('latin-1')
+        nameLen   = len(nameBytes)
+
+        if d_type == bool:
+            valueBytes = struct.pack('B', 1 if value == True else 0)
+
+        if d_type in (int, float):
+            valueBytes = struct.pack('f',float(value))
+
+        if d_type == str:
+            valueBytes = (value + '\x00').encode('latin-1')
+
+        valueLen = len(valueBytes)
+
+        # 4ByteHeader + NameLenByte + NameBytes + ValueLen2Bytes + ValueBytes
+        totalLen = nameLen + valueLen + 7
+
+        payload = struct.pack(
+            '<H4sB{}sH{}s'.format(nameLen,valueLen),
+            totalLen, LegacyEV3Mailbox.headerBytes,
+            nameLen, nameBytes,
+            valueLen, valueBytes
+        )
+
+        return EV3Mailbox(name,value,d_type,payload)
+
+def check_identical():
+    """
+    Both codecs must produce the same bytes and decode to the same values
+    """
+
+    for name, value in TEST_VECTORS:
+        payload = LegacyEV3Mailbox.encode(name, value).payload
+        if EV3Mailbox.encode(name, value).payload != payload:
+            raise AssertionError('Encode differs for {}'.format(name))
+        if EV3Mailbox._decode(payload) != LegacyEV3Mailbox.decode(payload):
+            raise AssertionError('Decode differs for {}'.format(name))
+        if (len(payload) - len(name) == 12 and
+            EV3Mailbox._decode(payload, float) !=
+            LegacyEV3Mailbox.decode(payload, float)):
+            raise AssertionError('Forced decode differs for {}'.format(name))
+
+def bench(iterations):
+    """
+    Time encode and decode of all the test vectors for both codecs.
+    Returns {operation: (legacy ops/s, current ops/s)}
+    """
+
+    payloads = [LegacyEV3Mailbox.encode(n, v).payload for n, v in TEST_VECTORS]
+    count    = iterations * len(TEST_VECTORS)
+
+    def rate(func):
+        return count / min(timeit.repeat(func, number=iterations, repeat=5))
+
+    return {
+        'encode': (
+            rate(lambda: [LegacyEV3Mailbox.encode(n, v) for n, v in TEST_VECTORS]),
+            rate(lambda: [EV3Mailbox.encode(n, v) for n, v in TEST_VECTORS]),
+        ),
+        'decode': (
+            rate(lambda: [LegacyEV3Mailbox.decode(p) for p in payloads]),
+            rate(lambda: [EV3Mailbox._decode(p) for p in payloads]),
+        ),
+    }
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    check_identical()
+    print('Output identical for {} test vectors'.format(len(TEST_VECTORS)))
+
+    for op, (legacy, current) in bench(iterations).items():
+        print('{:8} legacy {:>10.0f} ops/s  current {:>10.0f} ops/s  x{:.2f}'.format(
+            op, legacy, current, current / legacy
+        ))
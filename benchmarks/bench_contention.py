@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Contention benchmark for EV3Messages.Message: one producer and N consumer
+# threads on the same mailbox, comparing the Condition based FIFO with the
+# original Event + Lock pair.
+#
+# Usage: python3 benchmarks/bench_contention.py [messages] [max consumers]
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ev3messages import EV3Messages
+
+class LegacyMessage():
+    """
+    The original Event + Lock FIFO, kept as the reference
+    """
+
+    def __init__(self, name):
+        self.name  = name
+        self.event = threading.Event()
+        self.lock  = threading.Lock()
+        self.fifo  = []
+
+    def add(self, msg):
+        with self.lock:
+            self.fifo.append(msg)
+            self.event.set()
+
+    def get(self, timeout=None):
+        received = self.event.wait(timeout)
+
+        msg = None
+        if received == True:
+            with self.lock:
+                msg = self.fifo.pop(0) if len(self.fifo) != 0 else None
+                if len(self.fifo) == 0:
+                    self.event.clear()
+
+        return(msg)
+
+def run(message, messages, consumers):
+    """
+    Push messages through the FIFO to the consumers. Returns (messages/s,
+    get calls that came back empty without a timeout or shutdown).
+    """
+
+    received = [0]
+    empty    = [0]
+    lock     = threading.Lock()
+    done     = threading.Event()
+
+    def consume():
+        while not done.is_set():
+            msg = message.get(0.5)
+            with lock:
+                if msg == None:
+                    empty[0] += 1
+                else:
+                    received[0] += 1
+                    if received[0] == messages:
+                        done.set()
+
+    threads = [threading.Thread(target=consume, daemon=True) for _ in range(consumers)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    for i in range(messages):
+        message.add(i)
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    # Release the consumers still waiting for a message
+    for thread in threads:
+        message.add(-1)
+    for thread in threads:
+        thread.join()
+
+    return messages / elapsed, empty[0]
+
+def bench(messages, max_consumers):
+    """
+    Returns [(consumers, legacy result, current result)]
+    """
+
+    results   = []
+    consumers = 1
+    while consumers <= max_consumers:
+        results.append((
+            consumers,
+            run(LegacyMessage('bench'), messages, consumers),
+            run(EV3Messages.Message('bench'), messages, consumers),
+        ))
+        consumers *= 2
+    return results
+
+if __name__ == '__main__':
+    messages      = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    max_consumers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    print('{:>9}  {:>12} {:>8}  {:>12} {:>8}'.format(
+        'consumers', 'legacy msg/s', 'empty', 'current msg/s', 'empty'
+    ))
+    for consumers, (legacy, legacy_empty), (current, current_empty) in bench(messages, max_consumers):
+        print('{:>9}  {:>12.0f} {:>8}  {:>12.0f} {:>8}'.format(
+            consumers, legacy, legacy_empty, current, current_empty
+        ))
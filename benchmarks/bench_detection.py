@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Detection throughput: frames per second of ORB + reference search on the
+# captured_images set, in-process on one thread and with DetectionPool for
+# 1, 2, 4, ... worker processes (frames shared through the memory ring).
+#
+# Usage: python3 benchmarks/bench_detection.py [images dir] [max workers] [rounds]
+
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from descriptor_cache import DescriptorCache
+from detection_pool import DetectionPool
+from reference_index import ReferenceIndex
+
+IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'captured_images')
+
+def load(path):
+    """
+    Returns (references, ORB, frames) for the images in path, the frames
+    resized to a typical 640x480 camera frame
+    """
+
+    orb    = cv2.ORB_create()
+    cache  = DescriptorCache(os.path.join(path, '.orb_cache'))
+    refs   = []
+    frames = []
+    for filename in sorted(os.listdir(path)):
+        filepath = os.path.join(path, filename)
+        if not os.path.isfile(filepath):
+            continue
+        result = cache.compute(filepath, orb)
+        if result is None:
+            continue
+        refs.append({'name': os.path.splitext(filename)[0], 'descriptors': result[1]})
+        frames.append(cv2.resize(cv2.imread(filepath), (640, 480)))
+    return refs, orb, frames
+
+class FrameSource():
+    """
+    Stands in for cv2.VideoCapture, replaying the frames a number of times
+    """
+
+    def __init__(self, frames, rounds):
+        self.frames = frames * rounds
+        self.index  = 0
+
+    def read(self):
+        if self.index >= len(self.frames):
+            return False, None
+        self.index += 1
+        return True, self.frames[self.index - 1]
+
+def bench(path, max_workers, rounds):
+    """
+    Returns [(mode, frames per second)]
+    """
+
+    refs, orb, frames = load(path)
+    index = ReferenceIndex(refs)
+    count = len(frames) * rounds
+
+    start = time.perf_counter()
+    for frame in frames * rounds:
+        _, des = orb.detectAndCompute(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), None)
+        index.best(des)
+    results = [('in-process', count / (time.perf_counter() - start))]
+
+    workers = 1
+    while workers <= max_workers:
+        with DetectionPool(refs, orb, workers=workers) as pool:
+            # The first round starts the workers and builds their indexes
+            for _ in pool.run(FrameSource(frames, 1)):
+                pass
+            start = time.perf_counter()
+            for _ in pool.run(FrameSource(frames, rounds)):
+                pass
+            results.append(('{} processes'.format(workers), count / (time.perf_counter() - start)))
+        workers *= 2
+    return results
+
+if __name__ == '__main__':
+    path        = sys.argv[1] if len(sys.argv) > 1 else IMAGES
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    rounds      = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    print('{:>12}  {:>10}'.format('mode', 'frames/s'))
+    for mode, fps in bench(path, max_workers, rounds):
+        print('{:>12}  {:>10.1f}'.format(mode, fps))
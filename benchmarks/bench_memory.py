@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# Memory benchmark: bytes held per queued received message, for the original
+# __dict__ based EV3Mailbox with per-message name strings, the current
+# __slots__ EV3Mailbox with interned names, and MailboxView.
+#
+# Usage: python3 benchmarks/bench_memory.py [messages]
+
+import collections
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ev3mailbox import EV3Mailbox, MailboxView
+from bench_codec import LegacyEV3Mailbox
+
+# A typical control stream: a few mailbox names, mostly numbers
+STREAM = [
+    ('classe', 1.0),
+    ('score', 87.5),
+    ('x', 320.0),
+    ('y', 240.0),
+    ('estado', 'detectado'),
+    ('ativo', True),
+]
+
+class DictMailbox():
+    """
+    The original EV3Mailbox layout: four attributes in a __dict__
+    """
+
+    def __init__(self, name, value, d_type, payload):
+        self.name    = name
+        self.value   = value
+        self.d_type  = d_type
+        self.payload = payload
+
+def legacy(payload):
+    name, value, d_type = LegacyEV3Mailbox.decode(payload)
+    return DictMailbox(name, value, d_type, payload)
+
+def view(payload):
+    message = MailboxView(payload)
+    message.name
+    return message
+
+def per_message(decode, messages):
+    """
+    Queue messages decoded with decode, as EV3Messages.Message does, and
+    return the bytes allocated per queued message.
+
+    Payloads are built before measuring as each one is a fresh bytes object
+    from recv in every case.
+    """
+
+    payloads = [
+        bytes(EV3Mailbox.encode(*STREAM[i % len(STREAM)]).payload)
+        for i in range(messages)
+    ]
+
+    fifo = collections.deque()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for payload in payloads:
+        fifo.append(decode(payload))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return (after - before) / messages
+
+def bench(messages):
+    """
+    Returns {layout: bytes per queued message}
+    """
+
+    return {
+        'legacy dict':  per_message(legacy, messages),
+        'slots+intern': per_message(EV3Mailbox.decode, messages),
+        'view':         per_message(view, messages),
+    }
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    results = bench(messages)
+    for layout, size in results.items():
+        print('{:14} {:8.1f} bytes/message  x{:.2f}'.format(
+            layout, size, size / results['legacy dict']
+        ))
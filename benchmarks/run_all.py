@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+# Benchmark suite: codec, EV3Messages over a loopback link and the vision
+# matching, written as JSON so results can be kept and compared between
+# releases.
+#
+#   codec      EV3Mailbox encode/decode ops/s (and the original codec's)
+#   memory     bytes held per queued received message
+#   messaging  EV3Messages round-trip p50/p99 latency and throughput against
+#              ev3simulator, over a socket pair and over TCP
+#   vision     frames/s of ORB alone, of the original per-reference knnMatch
+#              loop, of today's per-reference match_and_score and of the
+#              stacked ReferenceIndex on captured_images
+#
+# Usage: python3 benchmarks/run_all.py [--quick] [--only codec,vision]
+#                                      [--images DIR] [--output FILE]
+#                                      [--compare BASELINE] [--tolerance 0.1]
+#
+# With --compare, every metric is checked against a previous run's JSON and
+# the exit status is 1 if any got worse by more than the tolerance. Metrics
+# ending in _us or _bytes are better lower, all others better higher.
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(samples, p):
+    """
+    The p-th percentile of samples (nearest rank)
+    """
+
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def bench_codec(quick):
+    import bench_codec
+
+    bench_codec.check_identical()
+    results = {}
+    for op, (legacy, current) in bench_codec.bench(2000 if quick else 20000).items():
+        results[op + '_ops_per_s']        = current
+        results[op + '_legacy_ops_per_s'] = legacy
+    return results
+
+def bench_memory(quick):
+    import bench_memory
+
+    return {
+        layout.replace(' ', '_').replace('+', '_') + '_bytes': size
+        for layout, size in bench_memory.bench(10000 if quick else 100000).items()
+    }
+
+def messaging(transport, count):
+    """
+    Round trips and bulk throughput of EV3Messages against an echoing
+    EV3Simulator reached through transport
+    """
+
+    from ev3messages import EV3Messages
+
+    handler = EV3Messages(transport=transport, maxlen=None)
+    try:
+        if not handler.wait_connected(5):
+            raise RuntimeError('No connection to the simulator')
+
+        # One mailbox at a time: send, wait for the echo
+        latencies = []
+        start     = time.perf_counter()
+        for i in range(count):
+            sent = time.perf_counter()
+            handler.send('ping', float(i))
+            if handler.get('ping', 5) == None:
+                raise RuntimeError('Echo lost')
+            latencies.append(time.perf_counter() - sent)
+        round_trips = count / (time.perf_counter() - start)
+
+        # Everything posted through the writer thread, then read back
+        start = time.perf_counter()
+        for i in range(count):
+            handler.post('bulk', float(i))
+        for i in range(count):
+            if handler.get('bulk', 5) == None:
+                raise RuntimeError('Echo lost')
+        posted = count / (time.perf_counter() - start)
+
+        # Batches of 20 in one write each
+        batch = [('batch', float(i)) for i in range(20)]
+        start = time.perf_counter()
+        for i in range(count // len(batch)):
+            handler.send_many(batch)
+        for i in range(count // len(batch) * len(batch)):
+            if handler.get('batch', 5) == None:
+                raise RuntimeError('Echo lost')
+        batched = count // len(batch) * len(batch) / (time.perf_counter() - start)
+    finally:
+        handler.stop()
+        handler.recv_thread.join(5)
+
+    return {
+        'round_trip_p50_us':      percentile(latencies, 50) * 1e6,
+        'round_trip_p99_us':      percentile(latencies, 99) * 1e6,
+        'round_trips_per_s':      round_trips,
+        'post_get_msgs_per_s':    posted,
+        'send_many_msgs_per_s':   batched,
+    }
+
+def bench_messaging(quick):
+    from ev3simulator import EV3Simulator
+    from ev3transport import SocketPairTransport, TCPTransport
+
+    count   = 500 if quick else 5000
+    results = {}
+
+    simulator = EV3Simulator()
+    try:
+        results['socketpair'] = messaging(SocketPairTransport(serve=simulator.serve), count)
+    finally:
+        simulator.close()
+
+    simulator = EV3Simulator()
+    try:
+        results['tcp'] = messaging(TCPTransport(*simulator.listen()), count)
+    finally:
+        simulator.close()
+
+    return results
+
+def legacy_match_and_score(des_ref, des_frame, matcher):
+    """
+    The original per-reference scoring with BFMatcher.knnMatch, copied
+    verbatim from send_mailbox.py and kept here only as the speed baseline
+    """
+    if des_ref is None or des_frame is None or len(des_ref) == 0:
+        return 0.0, 0
+    matches = matcher.knnMatch(des_ref, des_frame, k=2)
+    good = []
+    for pair in matches:
+        if len(pair) < 2:
+            continue
+        m, n = pair
+        if m.distance < 0.75 * n.distance:
+            good.append(m)
+    score = (len(good) / len(des_ref)) * 100
+    return score, len(good)
+
+def bench_vision(quick, images):
+    import cv2
+    from bench_detection import load
+    from reference_index import ReferenceIndex
+    from send_mailbox import match_and_score
+
+    if not os.path.isdir(images):
+        return {'skipped': 'no images in {}'.format(images)}
+
+    refs, orb, frames = load(images)
+    index  = ReferenceIndex(refs)
+    rounds = 1 if quick else 5
+    grays  = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames] * rounds
+
+    start = time.perf_counter()
+    described = [orb.detectAndCompute(gray, None)[1] for gray in grays]
+    orb_time  = time.perf_counter() - start
+
+    # The original loop: one knnMatch per reference, per frame
+    bf    = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+    start = time.perf_counter()
+    for des_frame in described:
+        max(legacy_match_and_score(ref['descriptors'], des_frame, bf)[0] for ref in refs)
+    legacy_time = time.perf_counter() - start
+
+    # Still one call per reference, with the vectorised ratio test
+    start = time.perf_counter()
+    for des_frame in described:
+        max(match_and_score(ref['descriptors'], des_frame)[0] for ref in refs)
+    per_ref_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for des_frame in described:
+        index.best(des_frame)
+    index_time = time.perf_counter() - start
+
+    return {
+        'references':             len(refs),
+        'frames':                 len(grays),
+        'orb_fps':                len(grays) / orb_time,
+        'legacy_knn_fps':         len(grays) / (orb_time + legacy_time),
+        'match_and_score_fps':    len(grays) / (orb_time + per_ref_time),
+        'reference_index_fps':    len(grays) / (orb_time + index_time),
+    }
+
+def environment():
+    """
+    What the numbers were measured on
+    """
+
+    info = {
+        'time':     time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python':   platform.python_version(),
+        'platform': platform.platform(),
+        'cpus':     os.cpu_count(),
+    }
+    try:
+        info['commit'] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    for module in ('numpy', 'cv2'):
+        try:
+            info[module] = __import__(module).__version__
+        except ImportError:
+            pass
+    return info
+
+def flatten(results, prefix=''):
+    """
+    {'a': {'b': 1}} -> {'a.b': 1}, numbers only
+    """
+
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+def compare(results, baseline, tolerance):
+    """
+    Print each metric against the baseline; returns the regressed ones
+    """
+
+    current    = flatten(results)
+    previous   = flatten(baseline)
+    regressed  = []
+    for key in sorted(current):
+        if key not in previous or previous[key] == 0 or key.startswith('environment.'):
+            continue
+        if key.endswith(('references', 'frames')):
+            continue
+        ratio = current[key] / previous[key]
+        worse = ratio - 1 if key.endswith(('_us', '_bytes')) else 1 - ratio
+        flag  = ''
+        if worse > tolerance:
+            regressed.append(key)
+            flag = '  REGRESSION'
+        print('{:50} {:>14.1f} {:>14.1f}  x{:.2f}{}'.format(key, previous[key], current[key], ratio, flag), file=sys.stderr)
+    return regressed
+
+SUITES = {
+    'codec':     bench_codec,
+    'memory':    bench_memory,
+    'messaging': bench_messaging,
+    'vision':    bench_vision,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the benchmarks and write JSON')
+    parser.add_argument('--quick', action='store_true', help='fewer iterations, for a smoke test')
+    parser.add_argument('--only', default=','.join(SUITES), help='comma separated suites')
+    parser.add_argument('--images', default=os.path.join(ROOT, 'captured_images'))
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    parser.add_argument('--compare', help='previous JSON output to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown, 0.1 = 10%%')
+    args = parser.parse_args()
+
+    results = {'environment': environment()}
+    for name in args.only.split(','):
+        if name not in SUITES:
+            parser.error('unknown suite {}'.format(name))
+        print('Running {}...'.format(name), file=sys.stderr)
+        if name == 'vision':
+            results[name] = SUITES[name](args.quick, args.images)
+        else:
+            results[name] = SUITES[name](args.quick)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(results, json.load(f), args.tolerance)
+        if regressed:
+            print('{} metrics regressed by more than {:.0%}'.format(len(regressed), args.tolerance), file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import cv2
+import numpy as np
+
+# Atributos de cv2.KeyPoint guardados no cache, nesta ordem
+KEYPOINT_FIELDS = ('x', 'y', 'size', 'angle', 'response', 'octave', 'class_id')
+
+
+def orb_params(orb):
+    """
+    Parâmetros do ORB que mudam os descritores (entram na chave do cache)
+    """
+    return (
+        orb.getMaxFeatures(), orb.getScaleFactor(), orb.getNLevels(),
+        orb.getEdgeThreshold(), orb.getFirstLevel(), orb.getWTA_K(),
+        int(orb.getScoreType()), orb.getPatchSize(), orb.getFastThreshold(),
+    )
+
+
+def clone_orb(orb):
+    """
+    Novo ORB com os mesmos parâmetros (um por thread, o ORB não é thread-safe)
+    """
+    (nfeatures, scale_factor, nlevels, edge_threshold, first_level,
+     wta_k, score_type, patch_size, fast_threshold) = orb_params(orb)
+    return cv2.ORB_create(nfeatures, scale_factor, nlevels, edge_threshold,
+                          first_level, wta_k, score_type, patch_size, fast_threshold)
+
+
+def keypoints_to_array(keypoints):
+    """
+    Converte uma lista de cv2.KeyPoint em um array float32 (N x 7)
+    """
+    return np.array(
+        [(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id)
+         for kp in keypoints],
+        dtype=np.float32,
+    ).reshape(-1, len(KEYPOINT_FIELDS))
+
+
+def array_to_keypoints(array):
+    """
+    Converte o array do cache de volta para uma lista de cv2.KeyPoint
+    """
+    return [
+        cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response),
+                     int(octave), int(class_id))
+        for x, y, size, angle, response, octave, class_id in array
+    ]
+
+
+class DescriptorCache:
+    """
+    Cache em disco dos keypoints e descritores ORB das imagens de referência.
+
+    Cada imagem vira dois arquivos .npy (keypoints e descritores) cujo nome é
+    um hash do caminho, mtime, tamanho do arquivo e parâmetros do ORB. Uma
+    imagem nova ou alterada (ou outro ORB) gera outra chave e é recalculada;
+    as demais são abertas com mmap, sem ler o arquivo inteiro.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, filepath, orb, scale=1.0):
+        stat = os.stat(filepath)
+        params = orb_params(orb)
+        if scale != 1.0:
+            # Sem a escala na chave quando é 1.0, para não invalidar caches antigos
+            params += (scale,)
+        key = repr((os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size, params))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        return (os.path.join(self.directory, key + '.kp.npy'),
+                os.path.join(self.directory, key + '.des.npy'))
+
+    def compute(self, filepath, orb, scale=1.0):
+        """
+        Devolve (keypoints, descritores) da imagem, do cache quando possível.
+        keypoints vem como array N x 7 (veja array_to_keypoints) e descritores
+        como no detectAndCompute (None se não houver features).
+        Com scale diferente de 1.0 a imagem é reduzida antes do ORB, e os
+        keypoints ficam nas coordenadas da imagem reduzida.
+        Devolve None se a imagem não puder ser lida.
+        """
+        key = self._key(filepath, orb, scale)
+        kp_path, des_path = self._paths(key)
+        self.used.update((kp_path, des_path))
+
+        try:
+            keypoints = np.load(kp_path, mmap_mode='r')
+            descriptors = np.load(des_path, mmap_mode='r')
+            self.hits += 1
+        except (OSError, ValueError):
+            img = cv2.imread(filepath, cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                return None
+            if scale != 1.0:
+                img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+            kp, des = orb.detectAndCompute(img, None)
+            keypoints = keypoints_to_array(kp)
+            descriptors = des if des is not None else np.empty((0, 32), dtype=np.uint8)
+            self._save(kp_path, keypoints)
+            self._save(des_path, descriptors)
+            self.misses += 1
+
+        if len(descriptors) == 0:
+            descriptors = None
+        return keypoints, descriptors
+
+    def _save(self, path, array):
+        # Grava num temporário e renomeia, para não deixar arquivo pela metade
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = path + '.tmp.npy'
+        np.save(tmp, array)
+        os.replace(tmp, path)
+
+    def prune(self):
+        """
+        Apaga do cache os arquivos que não foram usados desde a criação
+        (imagens removidas ou alteradas, parâmetros antigos do ORB)
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith('.npy') and path not in self.used:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
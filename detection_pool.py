@@ -0,0 +1,223 @@
+import collections
+import multiprocessing
+import queue
+import threading
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from descriptor_cache import orb_params
+from reference_index import ReferenceIndex
+
+
+def _attach(name):
+    """
+    Abre o bloco de memória compartilhada criado pelo processo principal.
+    Só o principal apaga o bloco; os workers usam o mesmo resource_tracker
+    dele, e no Python 3.13+ nem se registram nele (track=False).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker(shm_name, slots, shape, dtype, names, descriptors, params, by_class, tasks, results):
+    """
+    Processo de detecção: lê o frame direto do anel na memória compartilhada,
+    roda ORB + busca na sua cópia do índice e devolve só o resultado
+    """
+    shm = _attach(shm_name)
+    ring = np.ndarray((slots,) + shape, dtype=dtype, buffer=shm.buf)
+    index = ReferenceIndex([{'name': name, 'descriptors': des}
+                            for name, des in zip(names, descriptors)])
+    orb = cv2.ORB_create(*params)
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, slot = task
+            try:
+                frame = ring[slot]
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+                _, des_frame = orb.detectAndCompute(gray, None)
+                result = index.best_class(des_frame) if by_class else index.best(des_frame)
+                results.put((seq, slot, result, None))
+            except Exception as e:
+                results.put((seq, slot, None, f"{type(e).__name__}: {e}"))
+    finally:
+        del ring
+        shm.close()
+
+
+class DetectionPool:
+    """
+    Detecção em vários processos, para usar todos os núcleos (uma thread
+    Python só usa um, por causa do GIL).
+
+    Os frames não são serializados: ficam num anel de slots frames de
+    tamanho fixo em multiprocessing.shared_memory. submit() copia o frame
+    para um slot livre e manda só (seq, slot) para os workers; o slot volta
+    a ficar livre quando o resultado chega. Cada worker monta a sua própria
+    cópia do índice de referências e o seu ORB, com os mesmos parâmetros do
+    ORB que calculou as referências.
+
+    Os resultados saem na ordem em que os frames foram entregues (result e
+    run), mesmo que os workers terminem fora de ordem. Vários produtores
+    (várias câmeras) podem chamar submit() ao mesmo tempo.
+
+    O anel é criado no primeiro frame; todos os frames precisam ter o mesmo
+    formato que ele.
+    """
+
+    def __init__(self, refs, orb, workers=None, slots=None, by_class=False):
+        self.names = [ref['name'] for ref in refs]
+        # Cópias normais dos descritores (os do cache são mmap)
+        self.descriptors = [None if ref['descriptors'] is None else np.array(ref['descriptors'])
+                            for ref in refs]
+        self.params = orb_params(orb)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.slots = slots or 2 * self.workers
+        self.by_class = by_class
+
+        self.context = multiprocessing.get_context()
+        self.tasks = self.context.Queue()
+        self.results_queue = self.context.Queue()
+        self.processes = []
+        self.shm = None
+        self.ring = None
+
+        self.lock = threading.Lock()
+        self.free = queue.Queue()
+        self.next_seq = 0
+        self.done = {}
+        self.done_cond = threading.Condition()
+        self.collecting = False
+
+    def _start(self, shape, dtype):
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize * self.slots
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.ring = np.ndarray((self.slots,) + shape, dtype=dtype, buffer=self.shm.buf)
+        for slot in range(self.slots):
+            self.free.put(slot)
+
+        for _ in range(self.workers):
+            process = self.context.Process(
+                target=_worker,
+                args=(self.shm.name, self.slots, shape, np.dtype(dtype).str, self.names,
+                      self.descriptors, self.params, self.by_class, self.tasks, self.results_queue),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+        print(f"[INFO] {self.workers} processos de detecção, anel de {self.slots} frames {shape}")
+
+    def submit(self, frame, block=True):
+        """
+        Copia o frame para um slot livre do anel e o entrega aos workers.
+        Devolve o número de sequência do frame, ou None se block=False e
+        não houver slot livre.
+        """
+        with self.lock:
+            if self.ring is None:
+                self._start(frame.shape, frame.dtype)
+            elif frame.shape != self.ring.shape[1:] or frame.dtype != self.ring.dtype:
+                raise ValueError(f"Frame {frame.shape} {frame.dtype} não cabe no anel "
+                                 f"{self.ring.shape[1:]} {self.ring.dtype}")
+
+        while True:
+            try:
+                slot = self.free.get(timeout=0.1 if block else 0)
+                break
+            except queue.Empty:
+                if not block:
+                    return None
+                # Ninguém está recolhendo os resultados: recolhe aqui para liberar slots
+                self._collect(timeout=0.1)
+
+        self.ring[slot] = frame
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            self.tasks.put((seq, slot))
+        return seq
+
+    def _collect(self, timeout):
+        """
+        Lê um resultado dos workers (se houver) e libera o slot dele
+        """
+        with self.done_cond:
+            if self.collecting:
+                self.done_cond.wait(timeout)
+                return
+            self.collecting = True
+        try:
+            try:
+                seq, slot, result, error = self.results_queue.get(timeout=timeout)
+            except queue.Empty:
+                if self.processes and not all(p.is_alive() for p in self.processes):
+                    raise RuntimeError("Um processo de detecção terminou inesperadamente") from None
+                return
+            self.free.put(slot)
+            with self.done_cond:
+                self.done[seq] = (result, error)
+        finally:
+            with self.done_cond:
+                self.collecting = False
+                self.done_cond.notify_all()
+
+    def result(self, seq):
+        """
+        Espera e devolve o resultado do frame seq (nome, pontuação)
+        """
+        while True:
+            with self.done_cond:
+                if seq in self.done:
+                    result, error = self.done.pop(seq)
+                    break
+            self._collect(timeout=0.5)
+        if error is not None:
+            raise RuntimeError(f"Erro na detecção do frame {seq}: {error}")
+        return result
+
+    def run(self, cap):
+        """
+        Lê a câmera e gera (frame_idx, frame, resultado) em ordem, mantendo
+        o anel cheio para todos os workers terem trabalho
+        """
+        pending = collections.deque()
+        frame_idx = 0
+        eof = False
+        while True:
+            while not eof and len(pending) < self.slots:
+                ret, frame = cap.read()
+                if not ret:
+                    eof = True
+                    break
+                frame_idx += 1
+                pending.append((self.submit(frame), frame_idx, frame))
+            if not pending:
+                return
+            seq, idx, frame = pending.popleft()
+            yield idx, frame, self.result(seq)
+
+    def close(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        if self.shm is not None:
+            self.ring = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+# A Python3 asyncio class for handling EV3g Mailbox messages
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import socket
+import time
+import sys
+from ev3mailbox import EV3Mailbox, EV3MailboxFramer
+from ev3transport import RFCOMMTransport, TCPTransport
+
+class LinkStream():
+    """
+    asyncio reader and writer over a transport link that isn't a socket
+    (PyBluez, a serial port): its blocking recv and sendall run in the
+    default executor
+    """
+
+    def __init__(self, link):
+        self.link    = link
+        self.pending = b''
+        self.lock    = asyncio.Lock()
+
+    async def read(self, size):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                return await loop.run_in_executor(None, self.link.recv, size)
+            except TimeoutError:
+                # The link's recv timeout; keep waiting
+                continue
+
+    def write(self, data):
+        self.pending += bytes(data)
+
+    async def drain(self):
+        # One sendall at a time, so writes go out in order
+        async with self.lock:
+            data, self.pending = self.pending, b''
+            if data:
+                await asyncio.get_running_loop().run_in_executor(None, self.link.sendall, data)
+
+    def close(self):
+        self.link.close()
+
+    async def wait_closed(self):
+        pass
+
+async def open_stream(transport):
+    """
+    Open an ev3transport.Transport from an event loop and return an asyncio
+    (reader, writer) pair for it. The (blocking) open runs in the default
+    executor. Socket links (TCP, socket pair, AF_BLUETOOTH) are handed to
+    asyncio directly; any other link is wrapped in a LinkStream.
+    """
+    link = await asyncio.get_running_loop().run_in_executor(None, transport.open, 1.0)
+
+    if isinstance(link, socket.socket):
+        link.setblocking(False)
+        return await asyncio.open_connection(sock=link)
+
+    stream = LinkStream(link)
+    return stream, stream
+
+class EV3AsyncMessages():
+    """
+    Class to handle sending and receiving of EV3 Mailbox messages from an
+    asyncio event loop. One reader task per EV3 replaces the receive thread
+    and the per-name threads of EV3Messages, so a single loop can drive many
+    EV3s.
+    """
+
+    # What to do with a new message when its mailbox's queue is full
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    BLOCK       = 'block'
+
+    async def connect(self):
+        """
+        Ensure we're connected to the remote EV3 and the reader is running
+        """
+        if not self.active:
+            raise OSError("EV3AsyncMessages has been closed")
+
+        async with self.lock:
+            if self.writer != None:
+                return
+
+            try:
+                print("{}: Connection attempt to {}".format(time.asctime(), self.transport), file=sys.stderr)
+                reader, writer = await open_stream(self.transport)
+                print("{}: Connected".format(time.asctime()), file=sys.stderr)
+            except Exception as e:
+                print("{}: Failed to connect - {}".format(time.asctime(), e), file=sys.stderr)
+                raise OSError("Failed to connect to EV3g") from None
+
+            if not self.active:
+                # Closed while connecting
+                writer.close()
+                raise OSError("EV3AsyncMessages has been closed")
+
+            self.reader = reader
+            self.writer = writer
+
+        self._start()
+
+    def _start(self):
+        """
+        Start the reader task, which connects and reconnects on its own
+        """
+        if self.active == True and self.reader_task == None:
+            self.reader_task = asyncio.ensure_future(self._reader())
+
+    async def disconnect(self):
+        """
+        Close the connection. The reader task reconnects while active.
+        """
+        writer      = self.writer
+        self.reader = None
+        self.writer = None
+
+        if writer != None:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except:
+                pass
+
+    def _queue(self, name):
+        """
+        Find or create the queue for a mailbox name
+        """
+        if name not in self.queues:
+            self.queues[name]  = asyncio.Queue(self.maxlen or 0)
+            self.dropped[name] = 0
+        return self.queues[name]
+
+    def _put(self, mailbox):
+        """
+        Queue a received mailbox, applying the overflow policy if its queue
+        is full. Returns an awaitable only for BLOCK on a full queue.
+        """
+        queue = self._queue(mailbox.name)
+        if not queue.full():
+            queue.put_nowait(mailbox)
+        elif self.policy == EV3AsyncMessages.BLOCK:
+            return queue.put(mailbox)
+        else:
+            self.dropped[mailbox.name] += 1
+            if self.policy == EV3AsyncMessages.DROP_OLDEST:
+                queue.get_nowait()
+                queue.put_nowait(mailbox)
+        return None
+
+    def stats(self):
+        """
+        Per mailbox name queue depth and count of messages dropped on overflow
+        """
+        return {
+            name: {'depth': queue.qsize(), 'dropped': self.dropped[name]}
+            for name, queue in self.queues.items()
+        }
+
+    async def _next(self, queue, timeout=None):
+        """
+        Wait for the next message on queue. Returns None on timeout, or once
+        the client is closed and the queue is empty.
+        """
+        if not queue.empty():
+            return queue.get_nowait()
+        if not self.active:
+            return None
+
+        getter = asyncio.ensure_future(queue.get())
+        closed = asyncio.ensure_future(self.closed.wait())
+        try:
+            await asyncio.wait((getter, closed), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            if not getter.done():
+                # A cancelled get leaves its message, if any, in the queue
+                getter.cancel()
+
+        if getter.done() and not getter.cancelled():
+            return getter.result()
+        return None
+
+    async def get(self, name, timeout=None):
+        """
+        Wait for a message of the given name. Returns None on timeout or
+        once the client is closed.
+        """
+        self._start()
+
+        return await self._next(self._queue(name), timeout)
+
+    async def subscribe(self, name):
+        """
+        Yield every message of the given name until the client is closed:
+
+            async for msg in client.subscribe("number"):
+                ...
+        """
+        self._start()
+
+        queue = self._queue(name)
+        while True:
+            msg = await self._next(queue)
+            if msg == None:
+                return
+            yield msg
+
+    async def send(self, name, value, d_type=None):
+        """
+        Send one mailbox
+        """
+        await self._write(EV3Mailbox.encode(name, value, d_type).payload)
+
+    async def send_many(self, mailboxes):
+        """
+        Send a batch of (name, value[, d_type]) mailboxes in a single write
+        """
+        await self._write(EV3Mailbox.encode_many(mailboxes))
+
+    async def _write(self, payload):
+        # connect() raises once closed, rather than reconnecting
+        await self.connect()
+
+        try:
+            self.writer.write(payload)
+            await self.writer.drain()
+        except:
+            await self.disconnect()
+            raise OSError("Failed to send to EV3g") from None
+
+    async def close(self):
+        """
+        Stop the reader and release everyone waiting in get or subscribe.
+        Messages already queued can still be read, then every get returns
+        None.
+        """
+        self.active = False
+        self.closed.set()
+
+        if self.reader_task != None:
+            self.reader_task.cancel()
+            try:
+                await self.reader_task
+            except asyncio.CancelledError:
+                pass
+            self.reader_task = None
+
+        await self.disconnect()
+
+    async def _reader(self):
+        """
+        Receive messages from the EV3
+        """
+        framer = EV3MailboxFramer()
+        reader = None
+
+        while self.active == True:
+            try:
+                await self.connect()
+            except OSError:
+                # Failed to connect, so go to sleep for a bit and try again
+                await asyncio.sleep(self.retry)
+                continue
+
+            # A partial message from a previous connection can't be completed
+            if self.reader is not reader:
+                reader = self.reader
+                framer.clear()
+
+            try:
+                payload = await reader.read(1024)
+                if not payload:
+                    raise OSError("Connection closed by EV3g")
+            except Exception as e:
+                print("{}: Failed to recv - {}".format(time.asctime(), e), file=sys.stderr)
+                await self.disconnect()
+                continue
+
+            dropped = framer.dropped
+            for mailbox in framer.feed(payload):
+                blocked = self._put(mailbox)
+                if blocked != None:
+                    await blocked
+
+            if framer.dropped != dropped:
+                print("{}: Dropped bad message - {}".format(time.asctime(), framer.error), file=sys.stderr)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __init__(self, address=None, port=1, tcp=False, timeout=10, retry=5,
+                 maxlen=1000, policy=DROP_OLDEST, transport=None):
+        """
+        Constructor
+
+        The EV3 is reached through transport, any ev3transport.Transport
+        (RFCOMM, USB serial, TCP, a socket pair), as with EV3Messages. Without
+        one, address/port is the EV3's BT MAC address and RFCOMM channel, or
+        with tcp=True a host and TCP port connected within timeout seconds.
+        Must be created and used from within the same running event loop.
+
+        maxlen bounds each mailbox's queue (None for unbounded), so a mailbox
+        nobody reads can't grow forever. When one is full, policy
+        DROP_OLDEST discards its oldest message, DROP_NEWEST the new one, and
+        BLOCK holds up the reader (and so every mailbox) until it is read.
+        """
+        if policy not in (EV3AsyncMessages.DROP_OLDEST, EV3AsyncMessages.DROP_NEWEST, EV3AsyncMessages.BLOCK):
+            raise ValueError('Unknown overflow policy {}'.format(policy))
+
+        if transport == None:
+            if tcp:
+                transport = TCPTransport(address, port, timeout)
+            else:
+                transport = RFCOMMTransport(address, port)
+
+        self.active      = True
+        self.transport   = transport
+        self.address     = address
+        self.port        = port
+        self.timeout     = timeout
+        self.retry       = retry
+        self.lock        = asyncio.Lock()
+        self.reader      = None
+        self.writer      = None
+        self.reader_task = None
+        self.queues      = {}
+        self.maxlen      = maxlen
+        self.policy      = policy
+        self.dropped     = {}
+        self.closed      = asyncio.Event()
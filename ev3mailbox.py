@@ -18,13 +18,37 @@
     
 import struct
 
+def _need(length, size):
+    """
+    Raise the same error struct would if a buffer of length is shorter than size
+    """
+
+    if length < size:
+        raise struct.error(
+            'unpack_from requires a buffer of at least {} bytes '
+            '(actual buffer size is {})'.format(size, length)
+        )
+
 class EV3Mailbox:
     """
     Class to handle the encoding and decoding of the EV3g Mailbox byte stream.
     """
 
+    __slots__ = ('name', 'value', 'd_type', 'payload')
+
     headerBytes = '\x01\x00\x81\x9e'.encode('latin-1')
 
+    # Decoded names by their raw bytes, so that every message for a mailbox
+    # shares one str. Capped so a stream of junk names can't grow it forever.
+    _names    = {}
+    _maxNames = 1024
+
+    # Precompiled codecs for the fixed parts of a message:
+    # Size(2) + Header(4) + NameLen(1), ValueLen(2) and a Number value(4)
+    _head   = struct.Struct('<H4sB')
+    _length = struct.Struct('<H')
+    _number = struct.Struct('f')
+
     def __init__(self, name, value, d_type, payload):
         """
         Base object with all the data
@@ -43,40 +67,45 @@ class EV3Mailbox:
         return 'Mailbox: {}={}'.format(self.name, self.value)
 
     @staticmethod
-    def _decode(payload, d_type=None):
+    def _check(payload, offset=0, end=None):
         """
-        Decode a Mailbox message to its name and value.
-
-        Attempt to determine the type from the length of the contents, unless an
-        explicit type (d_type) was given.
+        Check the framing of the Mailbox message starting at offset in the
+        payload and return the lengths of its name and value, without
+        building either.
         """
 
+        if end == None:
+            end = len(payload)
+
         # Shortest message is a boolean:
         # HHHH L N 0 LL B = 10 bytes
-        mailboxSize = (struct.unpack_from('<H', payload, 0))[0]
+        mailboxSize, header, nameLen = EV3Mailbox._head.unpack_from(payload, offset)
         if mailboxSize < 10:
             raise BufferError(
                 'Payload is too small: {} < 10'.format(mailboxSize)
             )
 
         # Check that we have a Mailbox message header
-        header = (struct.unpack_from('<4s', payload, 2))[0]
         if header != EV3Mailbox.headerBytes:
             raise BufferError('Not a Mailbox message {} != {}'.format(
                 header, EV3Mailbox.headerBytes
             ))
 
-        # Get the name and its length
-        nameLen    = (struct.unpack_from('<B', payload, 6))[0] - 1
-        name, null =  struct.unpack_from('<{}sB'.format(nameLen), payload, 7)
+        # Get the name length and check its terminator. The length counts the
+        # NULL, so 0 is invalid, and the name must fit in the message.
+        if nameLen < 1 or 7 + nameLen > mailboxSize:
+            raise BufferError('Bad name length {} for a message of {}'.format(
+                nameLen, mailboxSize
+            ))
 
-        if null != 0:
-            raise BufferError('Name not NULL terminated')
+        nameLen = nameLen - 1
+        _need(end - offset, 8 + nameLen)
 
-        name = name.decode('latin-1')
+        if payload[offset + 7 + nameLen] != 0:
+            raise BufferError('Name not NULL terminated')
 
-        # Get the value and its length
-        valueLen = (struct.unpack_from('<H', payload, 8 + nameLen))[0]
+        # Get the value length
+        valueLen = (EV3Mailbox._length.unpack_from(payload, offset + 8 + nameLen))[0]
 
         if 8 + nameLen + valueLen != mailboxSize:
             raise BufferError(
@@ -85,15 +114,47 @@ class EV3Mailbox:
               )
             )
 
-        valueBytes = (struct.unpack_from(
-            '<{}s'.format(valueLen), payload, 10 + nameLen
-        ))[0]
+        _need(end - offset, 10 + nameLen + valueLen)
+
+        return nameLen, valueLen
+
+    @staticmethod
+    def _name(payload, start, nameLen):
+        """
+        Decode the name held in payload[start:start + nameLen], returning the
+        shared str for names that have been seen before
+        """
+
+        raw = payload[start:start + nameLen]
+        if type(raw) != bytes:
+            raw = bytes(raw)
+
+        name = EV3Mailbox._names.get(raw)
+
+        if name == None:
+            name = raw.decode('latin-1')
+            if len(EV3Mailbox._names) < EV3Mailbox._maxNames:
+                EV3Mailbox._names[raw] = name
+
+        return name
+
+    @staticmethod
+    def _value(payload, start, valueLen, d_type=None):
+        """
+        Decode the value held in payload[start:start + valueLen] and return
+        (value, d_type).
+
+        Attempt to determine the type from the length of the contents, unless an
+        explicit type (d_type) was given.
+        """
+
+        end = start + valueLen
 
         if d_type == None:
             # Attempt to work out the type. Assume text to start.
             d_type = str
 
-            if len(valueBytes) == 1:
+            if valueLen == 1:
                 d_type = bool
 
             # A 3 char string is indistinguishable from a float in terms of
@@ -101,40 +162,57 @@ class EV3Mailbox:
             # Assume it's a number if the last byte is not a 0 or there is
             # another zero in the bytes - e.g. Number 0 = \x00\x00\x00\x00.
 
-            if (len(valueBytes) == 4 and
-                (valueBytes[-1] != 0 or 0 in valueBytes[0:3])):
+            elif (valueLen == 4 and
+                (payload[end - 1] != 0 or 0 in payload[start:end - 1])):
                 d_type  = float
 
         # Double check the type as it may have been supplied.
-        if d_type not in (bool, int, float, str):
-            raise TypeError('Unknown type {}'.format(d_type))
+        if d_type == str:
+            if valueLen == 0 or payload[end - 1] != 0:
+                raise BufferError('Text value not NULL terminated')
 
-        if d_type == bool:
-            if len(valueBytes) != 1:
+            # str() rather than .decode() so any buffer works, memoryview included
+            value = str(payload[start:end - 1], 'latin-1')
+
+        elif d_type in (int, float):
+            if valueLen != 4:
+                raise TypeError('Wrong size for a number')
+
+            value = (EV3Mailbox._number.unpack_from(payload, start))[0]
+
+        elif d_type == bool:
+            if valueLen != 1:
                 raise TypeError('Wrong size for a boolean')
 
-            value = True if (struct.unpack('B', valueBytes))[0] else False
+            value = True if payload[start] else False
 
-        if d_type in (int, float):
-            if len(valueBytes) != 4:
-                raise TypeError('Wrong size for a number')
+        else:
+            raise TypeError('Unknown type {}'.format(d_type))
 
-            value = (struct.unpack('f', valueBytes))[0]
+        return value, d_type
 
-        if d_type == str:
-            if valueBytes[-1] != 0:
-                raise BufferError('Text value not NULL terminated')
-                
-            value = valueBytes[:-1].decode('latin-1')
+    @staticmethod
+    def _decode(payload, d_type=None):
+        """
+        Decode a Mailbox message to its name and value.
+
+        Attempt to determine the type from the length of the contents, unless an
+        explicit type (d_type) was given.
+        """
+
+        nameLen, valueLen = EV3Mailbox._check(payload)
+
+        name = EV3Mailbox._name(payload, 7, nameLen)
+
+        value, d_type = EV3Mailbox._value(payload, 10 + nameLen, valueLen, d_type)
 
         return name, value, d_type
 
-    @classmethod
-    def encode(cls, name, value, d_type=None):
+    @staticmethod
+    def _encode(name, value, d_type=None):
         """
-        Create a mailbox based on a name, value and type (d_type).
-
-        Encode the message based on those parameters.
+        Check and coerce the value, then return its (value, d_type, nameBytes,
+        valueBytes) ready to be packed after a header.
         """
 
         # Attempt to define the d_type based on the instance type of the value
@@ -152,31 +230,76 @@ class EV3Mailbox:
                 raise TypeError('Unable to coerce type {} to {}'.format(s_type,d_type))
 
         nameBytes = (name + '\x00').encode('latin-1')
-        nameLen   = len(nameBytes)
 
         if d_type == bool:
-            valueBytes = struct.pack('B', 1 if value == True else 0)
+            valueBytes = b'\x01' if value == True else b'\x00'
 
         if d_type in (int, float):
-            valueBytes = struct.pack('f',float(value))
+            valueBytes = EV3Mailbox._number.pack(float(value))
 
         if d_type == str:
             valueBytes = (value + '\x00').encode('latin-1')
 
+        return value, d_type, nameBytes, valueBytes
+
+    @classmethod
+    def encode(cls, name, value, d_type=None):
+        """
+        Create a mailbox based on a name, value and type (d_type).
+
+        Encode the message based on those parameters.
+        """
+
+        value, d_type, nameBytes, valueBytes = EV3Mailbox._encode(name, value, d_type)
+
+        nameLen  = len(nameBytes)
         valueLen = len(valueBytes)
 
         # 4ByteHeader + NameLenByte + NameBytes + ValueLen2Bytes + ValueBytes
         totalLen = nameLen + valueLen + 7
 
-        payload = struct.pack(
-            '<H4sB{}sH{}s'.format(nameLen,valueLen),
-            totalLen, EV3Mailbox.headerBytes,
-            nameLen, nameBytes,
-            valueLen, valueBytes
-        )
+        payload = b''.join((
+            EV3Mailbox._head.pack(totalLen, EV3Mailbox.headerBytes, nameLen),
+            nameBytes,
+            EV3Mailbox._length.pack(valueLen),
+            valueBytes
+        ))
 
         return cls(name,value,d_type,payload)
 
+    @staticmethod
+    def encode_many(mailboxes):
+        """
+        Encode a batch of (name, value[, d_type]) tuples into one buffer.
+
+        The messages are packed back-to-back into a single pre-sized bytearray
+        so the whole batch can be written to the socket in one call.
+        """
+
+        parts = [EV3Mailbox._encode(*mailbox)[2:] for mailbox in mailboxes]
+
+        # Size(2) + Header(4) + NameLen(1) + ValueLen(2) per message
+        buffer = bytearray(sum(9 + len(n) + len(v) for n, v in parts))
+        offset = 0
+
+        for nameBytes, valueBytes in parts:
+            nameLen  = len(nameBytes)
+            valueLen = len(valueBytes)
+
+            EV3Mailbox._head.pack_into(
+                buffer, offset,
+                nameLen + valueLen + 7, EV3Mailbox.headerBytes, nameLen
+            )
+            offset += 7
+            buffer[offset:offset + nameLen] = nameBytes
+            offset += nameLen
+            EV3Mailbox._length.pack_into(buffer, offset, valueLen)
+            offset += 2
+            buffer[offset:offset + valueLen] = valueBytes
+            offset += valueLen
+
+        return buffer
+
     @classmethod
     def decode(cls, payload):
         """
@@ -203,20 +326,213 @@ class EV3Mailbox:
 
         return ' '.join('{:02x}'.format(c) for c in self.payload)
 
+class MailboxView:
+    """
+    Class for a received Mailbox message that is decoded on demand.
+
+    The view holds the receive buffer it came from plus the offsets of its
+    message, so nothing is copied when it is created. Only the framing is
+    checked up front: the name is decoded the first time it is read and the
+    value the first time value or d_type is read. It has the same attributes
+    and methods as an EV3Mailbox.
+    """
+
+    __slots__ = ('buffer', 'start', 'nameLen', 'valueLen', '_name', '_value', '_d_type')
+
+    def __init__(self, buffer, start=0, end=None):
+        """
+        View of the message at buffer[start:end]. The buffer should be
+        immutable (bytes) as it is shared rather than copied.
+        """
+
+        self.nameLen, self.valueLen = EV3Mailbox._check(buffer, start, end)
+
+        self.buffer  = buffer
+        self.start   = start
+        self._name   = None
+        self._d_type = None
+
+    @property
+    def end(self):
+        return self.start + 10 + self.nameLen + self.valueLen
+
+    @property
+    def name(self):
+        if self._name == None:
+            self._name = EV3Mailbox._name(self.buffer, self.start + 7, self.nameLen)
+
+        return self._name
+
+    @property
+    def value(self):
+        if self._d_type == None:
+            self._decode_value()
+
+        return self._value
+
+    @property
+    def d_type(self):
+        if self._d_type == None:
+            self._decode_value()
+
+        return self._d_type
+
+    @property
+    def payload(self):
+        if self.start == 0 and self.end == len(self.buffer):
+            return self.buffer
+
+        return bytes(self.buffer[self.start:self.end])
+
+    def _decode_value(self, d_type=None):
+        self._value, self._d_type = EV3Mailbox._value(
+            self.buffer, self.start + 10 + self.nameLen, self.valueLen, d_type
+        )
+
+    def force_number(self):
+        """
+        Change this view's type and value to a float
+        """
+
+        self._decode_value(float)
+
+    def detach(self):
+        """
+        Copy just this message out of the shared receive buffer, so that a
+        view kept for a long time doesn't hold on to the whole buffer
+        """
+
+        self.buffer = self.payload
+        self.start  = 0
+
+        return self
+
+    def mailbox(self):
+        """
+        A fully decoded EV3Mailbox copy of this view
+        """
+
+        return EV3Mailbox(self.name, self.value, self.d_type, self.payload)
+
+    __str__   = EV3Mailbox.__str__
+    raw_bytes = EV3Mailbox.raw_bytes
+
+class EV3MailboxFramer:
+    """
+    Class to split a received byte stream into EV3Mailbox messages.
+
+    A single recv may hold several messages back-to-back, or only part of one.
+    Bytes are kept in a rolling buffer and every message whose 2 byte length
+    prefix says it is complete is decoded.
+    """
+
+    def __init__(self):
+        """
+        Start with an empty buffer
+        """
+
+        self.buffer  = bytearray()
+        self.dropped = 0
+        self.error   = None
+
+    def clear(self):
+        """
+        Throw away any partial message, e.g. after a reconnect
+        """
+
+        del self.buffer[:]
+
+    def _split(self, data):
+        """
+        Add received bytes and return (source, [(start, end), ...]) for every
+        complete message.
+
+        source is immutable: the received bytes themselves when no partial
+        message was pending, which is the usual case, otherwise one copy of
+        the completed part of the rolling buffer.
+        """
+
+        if len(self.buffer) == 0 and type(data) == bytes:
+            source = data
+        else:
+            self.buffer += data
+            source = self.buffer
+
+        frames = []
+        start  = 0
+        end    = len(source)
+
+        while end - start >= 2:
+            frameEnd = start + 2 + (source[start] | source[start + 1] << 8)
+            if frameEnd > end:
+                break
+
+            frames.append((start, frameEnd))
+            start = frameEnd
+
+        if source is self.buffer:
+            source = bytes(self.buffer[:start])
+            del self.buffer[:start]
+        elif start != end:
+            self.buffer += source[start:]
+
+        return source, frames
+
+    def feed(self, data):
+        """
+        Add received bytes and return a list of all the complete mailboxes.
+
+        A complete message that fails to decode is skipped and counted in
+        dropped (the last exception is kept in error). As the length prefix
+        is still valid the stream stays in step.
+        """
+
+        source, frames = self._split(data)
+
+        mailboxes = []
+        for start, end in frames:
+            try:
+                mailboxes.append(EV3Mailbox.decode(source[start:end]))
+            except Exception as e:
+                self.dropped += 1
+                self.error    = e
+
+        return mailboxes
+
+    def feed_views(self, data):
+        """
+        As feed, but return MailboxView objects sharing the received bytes
+        instead of decoded EV3Mailbox copies. Only the framing is checked
+        here, so dropped only counts badly framed messages.
+        """
+
+        source, frames = self._split(data)
+
+        views = []
+        for start, end in frames:
+            try:
+                views.append(MailboxView(source, start, end))
+            except Exception as e:
+                self.dropped += 1
+                self.error    = e
+
+        return views
+
+# Name/value pairs covering each type and the ambiguous 3 char/float case
+TEST_VECTORS = [
+    ['monty','python'],
+    ['true',True],
+    ['T',True],
+    ['false',False],
+    ['F',False],
+    ['number',3.141],
+    ['zero',0],
+    ['ZERO','000'],
+    ['ReallySmall',5.90052E-39],
+]
+
 if __name__ == '__main__':
-    tests = [
-        ['monty','python'],
-        ['true',True],
-        ['T',True],
-        ['false',False],
-        ['F',False],
-        ['number',3.141],
-        ['zero',0],
-        ['ZERO','000'],
-        ['ReallySmall',5.90052E-39],
-    ]
-
-    for test in tests:
+    for test in TEST_VECTORS:
         message = EV3Mailbox.encode(test[0], test[1])
         print('Encode --------------------')
         print(message)
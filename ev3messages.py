@@ -16,81 +16,305 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
     
+import collections
+import fnmatch
+import random
 import threading
+from concurrent.futures import Future
 import time
 import sys
-import bluetooth
-from ev3mailbox import EV3Mailbox
+from ev3mailbox import EV3Mailbox, EV3MailboxFramer
+from ev3transport import RFCOMMTransport
 
 class EV3Messages():
     """
     Class to handle sending and recieving of EV3 Mailbox messages
     """
 
+    # Overflow policies for a full Message FIFO
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    BLOCK       = 'block'
+
+    # Connection states
+    DISCONNECTED = 'disconnected'
+    CONNECTING   = 'connecting'
+    UP           = 'up'
+    BACKOFF      = 'backoff'
+    DRAINING     = 'draining'
+    STOPPED      = 'stopped'
+
     class Message():
         """
         Class to contain attributes for each message
         """
 
-        def __init__(self,name):
-            self.name  = name
-            self.event = threading.Event()
-            self.lock  = threading.Lock()
-            self.fifo  = []
+        def __init__(self, name, maxlen=None, policy='drop_oldest'):
+            """
+            maxlen bounds the FIFO (None for unbounded). When it is full, policy
+            decides what happens to a new message: DROP_OLDEST discards the
+            oldest queued one, DROP_NEWEST discards the new one and BLOCK makes
+            the producer wait for a consumer. maxlen=1 with DROP_OLDEST keeps
+            only the latest value, e.g. for sensor readings.
+
+            Consumers and a blocked producer wait on two conditions sharing
+            one lock, so each message wakes exactly one consumer.
+            """
+            self.name      = name
+            self.lock      = threading.Lock()
+            self.ready     = threading.Condition(self.lock)
+            self.space     = threading.Condition(self.lock)
+            self.fifo      = collections.deque()
+            self.closed    = False
+            self.dropped   = 0
+            self.max_depth = 0
+
+            self.configure(maxlen, policy)
+
+        def configure(self, maxlen=None, policy='drop_oldest'):
+            """
+            Change the bound and overflow policy. If more messages are queued
+            than the new bound allows, the oldest are dropped.
+            """
+            if policy not in (EV3Messages.DROP_OLDEST, EV3Messages.DROP_NEWEST, EV3Messages.BLOCK):
+                raise ValueError('Unknown overflow policy {}'.format(policy))
+            if maxlen != None and maxlen < 1:
+                raise ValueError('maxlen must be at least 1')
+
+            with self.lock:
+                self.maxlen = maxlen
+                self.policy = policy
+
+                while maxlen != None and len(self.fifo) > maxlen:
+                    self.fifo.popleft()
+                    self.dropped += 1
 
-            self.event.clear()
+                self.space.notify_all()
 
         def add(self, msg):
             """
-            Add a new mailbox message to FIFO and trigger any listeners
+            Add a new mailbox message to FIFO and wake one listener
             """
             with self.lock:
+                if self.maxlen != None:
+                    if self.policy == EV3Messages.BLOCK:
+                        while len(self.fifo) >= self.maxlen and not self.closed:
+                            self.space.wait()
+
+                    if len(self.fifo) >= self.maxlen:
+                        self.dropped += 1
+                        if self.policy != EV3Messages.DROP_OLDEST:
+                            return
+                        self.fifo.popleft()
+
                 self.fifo.append(msg)
-                self.event.set()
+                self.max_depth = max(self.max_depth, len(self.fifo))
+                self.ready.notify()
+
+        def get(self, timeout=None):
+            """
+            Wait for a mailbox and return it.
 
-        def get(self, timeout=None):     
+            Returns None if the timeout passes, or once the FIFO is closed and
+            drained. The two cases can be told apart by closed.
             """
-            Wait for a mailbox and return it
-            """       
-            received = self.event.wait(timeout)
+            with self.lock:
+                if timeout != None:
+                    deadline = time.monotonic() + timeout
+
+                while len(self.fifo) == 0:
+                    if self.closed:
+                        return None
 
-            msg = None
-            if received == True:
-                with self.lock:
-                    msg = self.fifo.pop(0) if len(self.fifo) != 0 else None
-                    if len(self.fifo) == 0:
-                        self.event.clear()
+                    if timeout == None:
+                        self.ready.wait()
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self.ready.wait(remaining):
+                            if len(self.fifo) == 0:
+                                return None
+
+                msg = self.fifo.popleft()
+                self.space.notify()
 
             return(msg)
 
+        def get_nowait(self):
+            """
+            Return the next mailbox, or None if there isn't one waiting
+            """
+            with self.lock:
+                if len(self.fifo) == 0:
+                    return None
+
+                msg = self.fifo.popleft()
+                self.space.notify()
+
+            return(msg)
+
+        def close(self):
+            """
+            Shut the FIFO down. Queued messages can still be read, after which
+            every waiting and future get returns None straight away. Any
+            blocked producer is released.
+            """
+            with self.lock:
+                self.closed = True
+                self.ready.notify_all()
+                self.space.notify_all()
+
+        def depth(self):
+            """
+            Number of messages waiting
+            """
+            return len(self.fifo)
+
+        def stats(self):
+            """
+            Queue depth, high-water mark and overflow drops for this mailbox
+            """
+            with self.lock:
+                return {
+                    'depth':     len(self.fifo),
+                    'max_depth': self.max_depth,
+                    'dropped':   self.dropped,
+                }
+
+    def _set_state(self, state):
+        """
+        Move to a new connection state and wake anyone waiting on it. Must
+        be called holding state_cond. Once stopped, connecting to flush the
+        writer doesn't leave DRAINING.
+        """
+        if not self.active and state != EV3Messages.STOPPED:
+            state = EV3Messages.DRAINING
+        self.state = state
+        self.state_cond.notify_all()
+
     def connect(self):
         """
         Ensure we're connected to the remote EV3
+
+        Only one thread makes the (slow) connection attempt; any other
+        caller waits for its outcome. No lock used for sending is held
+        meanwhile. A failed attempt moves to BACKOFF, and the receive thread
+        retries after a jittered exponential delay. Until then connect()
+        raises OSError at once instead of making another attempt, so
+        senders don't stall on a connect during an outage.
         """
-        with self.bt_lock:
-            if self.bt_socket == None:
+        with self.state_cond:
+            if self.state == EV3Messages.BACKOFF:
+                remaining = self.retry_at - time.monotonic()
+                if remaining > 0:
+                    raise OSError("EV3g unreachable, retrying in {:.2f}s".format(remaining))
+
+            while self.state == EV3Messages.CONNECTING:
+                self.state_cond.wait()
+                if self.bt_socket == None and self.state != EV3Messages.CONNECTING:
+                    raise OSError("Failed to connect to EV3g")
+
+            if self.bt_socket != None:
+                return
+
+            self._set_state(EV3Messages.CONNECTING)
+
+        try:
+            print("{}: Connection attempt to {}".format(time.asctime(), self.transport), file=sys.stderr)
+            bt_socket = self.transport.open(self.recv_timeout)
+        except Exception as e:
+            print("{}: BT failed to connect - {}".format(time.asctime(),e), file=sys.stderr)
+            with self.state_cond:
+                self.failures += 1
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (self.failures - 1))
+                self.retry_at = time.monotonic() + delay * random.uniform(0.5, 1.0)
+                self._set_state(EV3Messages.BACKOFF)
+            raise OSError("Failed to connect to EV3g") from None
+
+        with self.state_cond:
+            reconnected    = self.was_up
+            self.bt_socket = bt_socket
+            self.failures  = 0
+            self.was_up    = True
+            if reconnected:
+                self.reconnects += 1
+            self._set_state(EV3Messages.UP)
+        print("{}: BT Connected".format(time.asctime()), file=sys.stderr)
+
+        if reconnected:
+            if self.on_reconnect != None:
                 try:
-                    print("{}: Connection attempt to {}".format(time.asctime(), self.bt_address), file=sys.stderr)
-                    bt_socket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-                    bt_socket.connect((self.bt_address, 1))
-                    bt_socket.settimeout(5)
-                    self.bt_socket = bt_socket
-                    print("{}: BT Connected".format(time.asctime()), file=sys.stderr)
+                    self.on_reconnect(self)
                 except Exception as e:
-                    print("{}: BT failed to connect - {}".format(time.asctime(),e), file=sys.stderr)
-                    raise OSError("Failed to connect to EV3g") from None
+                    print("{}: on_reconnect failed - {}".format(time.asctime(), e), file=sys.stderr)
 
-    def disconnect(self):
+    def disconnect(self, bt_socket=None):
         """
         Disconnect the socket
+
+        bt_socket is the link that failed; if the handler has already moved
+        on to a newer one, that is left alone. None disconnects whatever
+        link is current.
         """
-        with self.bt_lock:
-            try:
-                if self.bt_socket != None:
-                    self.bt_socket.close()
-            except:
-                pass
+        with self.state_cond:
+            if bt_socket == None:
+                bt_socket = self.bt_socket
+            elif bt_socket is not self.bt_socket:
+                return
             self.bt_socket = None
+            if self.state == EV3Messages.UP:
+                self._set_state(EV3Messages.DISCONNECTED)
+
+        try:
+            if bt_socket != None:
+                bt_socket.close()
+        except:
+            pass
+
+    def wait_connected(self, timeout=None):
+        """
+        Wait until the link is up. Returns False on timeout or once stopped.
+        """
+        with self.state_cond:
+            return self.state_cond.wait_for(
+                lambda: self.state == EV3Messages.UP or not self.active, timeout
+            ) and self.active
+
+    def _message(self, name):
+        """
+        Find or create the FIFO for a mailbox name
+        """
+        with self.msgs_lock:
+            if name not in self.messages:
+                maxlen, policy = self.limits.get(name, (self.maxlen, self.policy))
+                self.messages[name] = EV3Messages.Message(name, maxlen, policy)
+                if not self.active:
+                    self.messages[name].close()
+            return self.messages[name]
+
+    def configure(self, name, maxlen=None, policy=DROP_OLDEST, latest=False):
+        """
+        Set the FIFO bound and overflow policy for one mailbox name.
+        latest=True keeps only the most recent value (maxlen=1, DROP_OLDEST).
+        """
+        if latest:
+            maxlen, policy = 1, EV3Messages.DROP_OLDEST
+
+        with self.msgs_lock:
+            self.limits[name] = (maxlen, policy)
+            message = self.messages.get(name)
+
+        if message == None:
+            message = self._message(name)
+        message.configure(maxlen, policy)
+
+    def stats(self):
+        """
+        Per mailbox name queue depth, high-water mark and dropped count
+        """
+        with self.msgs_lock:
+            messages = list(self.messages.values())
+
+        return {message.name: message.stats() for message in messages}
 
     def get(self, name=None, timeout=None):
         """
@@ -99,34 +323,232 @@ class EV3Messages():
         msg = None
 
         if name != None:
-            with self.msgs_lock:
-                if name not in self.messages:
-                    self.messages[name] = EV3Messages.Message(name)
-                message = self.messages[name]
-
-            msg = message.get(timeout)
+            msg = self._message(name).get(timeout)
 
         return msg
 
+    def select(self, names=None, timeout=None):
+        """
+        Wait for a message on any of several mailboxes and return it as
+        (name, mailbox).
+
+        names is a list of mailbox names, which may use shell-style wildcards
+        such as "sensor*"; None matches every mailbox. Returns (None, None) on
+        timeout or once stopped (active is then False).
+        """
+        if names != None:
+            names    = list(names)
+            patterns = [name for name in names if any(c in name for c in '*?[')]
+            for name in names:
+                if name not in patterns:
+                    self._message(name)
+
+        if timeout != None:
+            deadline = time.monotonic() + timeout
+
+        with self.arrived:
+            self.selecting += 1
+            try:
+                while True:
+                    with self.msgs_lock:
+                        if names == None:
+                            candidates = list(self.messages.values())
+                        else:
+                            candidates = [
+                                message for message in self.messages.values()
+                                if message.name in names or any(
+                                    fnmatch.fnmatchcase(message.name, pattern)
+                                    for pattern in patterns
+                                )
+                            ]
+
+                    # Start from a different mailbox each time so a busy one
+                    # can't starve the rest
+                    if len(candidates) != 0:
+                        self.next_select = (self.next_select + 1) % len(candidates)
+                        candidates = candidates[self.next_select:] + candidates[:self.next_select]
+
+                    for message in candidates:
+                        msg = message.get_nowait()
+                        if msg != None:
+                            return message.name, msg
+
+                    if not self.active:
+                        return None, None
+
+                    if timeout == None:
+                        self.arrived.wait()
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return None, None
+                        self.arrived.wait(remaining)
+            finally:
+                self.selecting -= 1
+
+    def get_any(self, timeout=None):
+        """
+        Wait for a message on any mailbox and return it as (name, mailbox)
+        """
+        return self.select(None, timeout)
+
+    def _notify_select(self):
+        """
+        Wake threads waiting in select
+        """
+        if self.selecting != 0:
+            with self.arrived:
+                self.arrived.notify_all()
+
+    def _sendall(self, payload):
+        """
+        Write payload to the current link, dropping that link (and only
+        that one) if the write fails
+        """
+        with self.bt_lock:
+            bt_socket = self.bt_socket
+            try:
+                if bt_socket != None:
+                    bt_socket.sendall(payload)
+                    return
+            except:
+                pass
+
+        if bt_socket != None:
+            self.disconnect(bt_socket)
+        raise OSError("Failed to send to EV3g")
+
     def send(self,name,value,d_type=None):
-        try:
-            self.connect()
-        except:
-            raise
+        ev3mailbox = EV3Mailbox.encode(name, value, d_type)
 
-        try:
-            with self.bt_lock:
-                ev3mailbox = EV3Mailbox.encode(name, value, d_type)
-                self.bt_socket.send(ev3mailbox.payload)
-        except:
-            self.disconnect()
-            raise OSError("Failed to send to EV3g") from None
+        self.connect()
+        self._sendall(ev3mailbox.payload)
+
+    def send_many(self, mailboxes):
+        """
+        Send a batch of (name, value[, d_type]) mailboxes in a single write
+        """
+        payload = EV3Mailbox.encode_many(mailboxes)
+
+        self.connect()
+        self._sendall(payload)
+
+    def post(self, name, value, d_type=None, latest=False):
+        """
+        Queue a mailbox for the writer thread and return straight away with a
+        concurrent.futures.Future. The future's result is None once the
+        mailbox has been written to the socket, or it raises OSError if the
+        write failed. Encoding errors are raised here, not in the future.
+
+        The writer thread is started by the first post. It owns the socket
+        for posted mailboxes, so a caller never waits for a (re)connect, and
+        everything queued while one write is in progress goes out together
+        in the next.
+
+        latest=True coalesces sensor-style streams: if a value for the same
+        name is still queued it is replaced by this one, keeping its place
+        in the queue, and both futures complete when it is written. A slow
+        link then holds at most one pending value per name instead of a
+        backlog of stale ones.
+        """
+        payload = EV3Mailbox.encode(name, value, d_type).payload
+        future  = Future()
+
+        with self.outbox_cond:
+            if not self.active:
+                raise OSError("EV3Messages has been stopped")
+
+            entry = self.coalesce.get(name) if latest else None
+            if entry != None:
+                entry[1] = payload
+                entry[2].append(future)
+                self.coalesced += 1
+            else:
+                entry = [name, payload, [future]]
+                self.outbox.append(entry)
+                if latest:
+                    self.coalesce[name] = entry
+
+            if self.writer == None:
+                self.writer = threading.Thread(target=self._writer_thread, daemon=self.daemon)
+                self.writer.start()
+            self.outbox_cond.notify()
+
+        return future
+
+    def pending(self):
+        """
+        Number of posted mailboxes not yet written
+        """
+        with self.outbox_cond:
+            return len(self.outbox)
+
+    def _writer_thread(self):
+        """
+        Write posted mailboxes to the EV3, a queued batch at a time
+        """
+        while True:
+            with self.outbox_cond:
+                while len(self.outbox) == 0 and self.active:
+                    self.outbox_cond.wait()
+                if len(self.outbox) == 0:
+                    break
+
+                batch = list(self.outbox)
+                self.outbox.clear()
+                self.coalesce.clear()
+
+            # Skip mailboxes whose every future was cancelled while queued
+            payloads = []
+            futures  = []
+            for name, payload, waiting in batch:
+                live = [future for future in waiting if future.set_running_or_notify_cancel()]
+                if len(live) != 0:
+                    payloads.append(payload)
+                    futures.extend(live)
+            if len(payloads) == 0:
+                continue
+
+            try:
+                self.connect()
+                self._sendall(b''.join(payloads))
+            except:
+                for future in futures:
+                    future.set_exception(OSError("Failed to send to EV3g"))
+                continue
+
+            for future in futures:
+                future.set_result(None)
 
     def stop(self):
         """
-        Stop the recieving thread
+        Stop the recieving thread, and the writer thread once it has written
+        the mailboxes already posted
+        """
+        with self.state_cond:
+            self.active = False
+            self._set_state(EV3Messages.DRAINING)
+
+        with self.outbox_cond:
+            self.outbox_cond.notify_all()
+
+        # Wake anyone waiting, including the receive thread if it is blocked
+        # on a full FIFO
+        with self.msgs_lock:
+            messages = list(self.messages.values())
+        for message in messages:
+            message.close()
+
+        with self.arrived:
+            self.arrived.notify_all()
+
+    def _dispatch(self, mailbox):
+        """
+        Add a received mailbox to the FIFO for its name
         """
-        self.active = False
+        if mailbox.name != None:
+            self._message(mailbox.name).add(mailbox)
+            self._notify_select()
 
     def _recv_thread(self):
         """
@@ -135,51 +557,148 @@ class EV3Messages():
 
         #print("Starting recv thread", file=sys.stderr)
 
+        framer = EV3MailboxFramer()
+        bt_socket = None
+        last_recv = time.monotonic()
+
         while self.active == True:
+            with self.state_cond:
+                if self.state == EV3Messages.BACKOFF:
+                    # Failed to connect, so wait a bit and try again.
+                    # stop() cuts this short.
+                    remaining = self.retry_at - time.monotonic()
+                    if remaining > 0:
+                        self.state_cond.wait(remaining)
+                        continue
+
             try:
                 self.connect()
             except:
-                # Failed to connect, so go to sleep for a bit and try again
-                time.sleep(5)
+                continue
+
+            # A partial message from a previous connection can't be completed
+            if self.bt_socket is not bt_socket:
+                bt_socket = self.bt_socket
+                framer.clear()
+                last_recv = time.monotonic()
+
+            # Lost again before we got here
+            if bt_socket == None:
                 continue
 
             try:
-                payload = self.bt_socket.recv(1024)
-                mailbox = EV3Mailbox.decode(payload)
-                name    = mailbox.name
-                if name != None:
-                    with self.msgs_lock:
-                        if name not in self.messages:
-                            self.messages[name] = EV3Messages.Message(name)
-                        message = self.messages[name] 
-
-                    message.add(mailbox)
-                #print("{}: Received: {}".format(time.asctime(), mailbox), file=sys.stderr)
-            except bluetooth.btcommon.BluetoothError as e:
-                if e.args[0] != "timed out":
-                    print("{}: BT Error - Failed to recv - {}".format(time.asctime(), e), file=sys.stderr)
-                    self.disconnect()
+                payload = bt_socket.recv(1024)
+                if not payload:
+                    raise OSError("Connection closed by EV3g")
+                last_recv = time.monotonic()
+
+                dropped = framer.dropped
+                # Views only decode the name for routing; the value is
+                # decoded if and when a reader looks at it
+                for mailbox in framer.feed_views(payload):
+                    self._dispatch(mailbox)
+                    #print("{}: Received: {}".format(time.asctime(), mailbox), file=sys.stderr)
+
+                if framer.dropped != dropped:
+                    print("{}: Dropped bad message - {}".format(time.asctime(), framer.error), file=sys.stderr)
+            except TimeoutError:
+                # A radio that went away silently never errors the socket
+                if self.idle_timeout != None and time.monotonic() - last_recv > self.idle_timeout:
+                    print("{}: Link Error - Nothing received for {}s".format(time.asctime(), self.idle_timeout), file=sys.stderr)
+                    self.disconnect(bt_socket)
+            except OSError as e:
+                # Link lost: the first reconnect attempt is immediate
+                if self.active:
+                    print("{}: Link Error - Failed to recv - {}".format(time.asctime(), e), file=sys.stderr)
+                self.disconnect(bt_socket)
             except Exception as e:
-                print("{}: General Error - Failed to recv - {}".format(time.asctime(), e), file=sys.stderr)
-                self.disconnect()
+                if self.active:
+                    print("{}: General Error - Failed to recv - {}".format(time.asctime(), e), file=sys.stderr)
+                self.disconnect(bt_socket)
+
+        # Close all FIFOs so that threads waiting on them get None and know to quit
+        with self.msgs_lock:
+            messages = list(self.messages.values())
+        for message in messages:
+            message.close()
 
-        # Put a None message on all FIFOs so that threads waiting on them know to quit
-        for message in self.messages:
-            self.messages[message].add(None)
+        # Let the writer flush what was posted before stop, then close the link
+        with self.outbox_cond:
+            writer = self.writer
+        if writer != None:
+            writer.join()
+        self.disconnect()
+        with self.state_cond:
+            self._set_state(EV3Messages.STOPPED)
 
         #print("Stopping recv thread", file=sys.stderr)
 
-    def __init__(self, btaddress):
+    def __init__(self, btaddress=None, port=1, maxlen=1000, policy=DROP_OLDEST,
+                 on_reconnect=None, backoff_base=0.05, backoff_max=5.0, recv_timeout=1.0,
+                 idle_timeout=None, transport=None, daemon=False):
         """
         Constructor
+
+        The EV3 is reached over Bluetooth RFCOMM at btaddress and port, or
+        over any other ev3transport.Transport given as transport (USB serial,
+        TCP, a socket pair).
+
+        maxlen and policy are the defaults for every mailbox FIFO, so that a
+        mailbox nobody reads can't grow forever. See configure() to change
+        them for one name.
+
+        After a failed connect the receive thread waits backoff_base seconds,
+        doubling per failure up to backoff_max, with random jitter. A lost
+        link is retried straight away. on_reconnect(handler) is called each
+        time the link comes back after having been up. recv_timeout is how
+        often the receive thread checks for stop().
+
+        A Bluetooth link that drops out silently can leave recv() waiting
+        with no error. With idle_timeout set, a link on which nothing has
+        been received for that many seconds is treated as lost and
+        reconnected; the EV3 program must then send something (e.g. a
+        heartbeat mailbox) more often than that.
+
+        daemon=True runs the receive and writer threads as daemon threads,
+        so a handler that is never stopped doesn't keep the process alive
+        (mailboxes still being posted are then lost at exit).
         """
-        self.active      = True
-        self.bt_address  = btaddress
-        self.bt_lock     = threading.Lock()
-        self.bt_socket   = None
+        if transport == None:
+            transport = RFCOMMTransport(btaddress, port)
+
+        self.active       = True
+        self.transport    = transport
+        self.bt_address   = btaddress
+        self.bt_port      = port
+        self.bt_lock      = threading.Lock()
+        self.bt_socket    = None
+        self.state        = EV3Messages.DISCONNECTED
+        self.state_cond   = threading.Condition()
+        self.failures     = 0
+        self.backoff_base = backoff_base
+        self.backoff_max  = backoff_max
+        self.retry_at     = 0.0
+        self.recv_timeout = recv_timeout
+        self.idle_timeout = idle_timeout
+        self.was_up       = False
+        self.reconnects   = 0
+        self.on_reconnect = on_reconnect
+        self.daemon       = daemon
+
+        self.maxlen      = maxlen
+        self.policy      = policy
+        self.limits      = {}
         self.messages    = {}
         self.msgs_lock   = threading.Lock()
-        self.recv_thread = threading.Thread(target=self._recv_thread)  
+        self.arrived     = threading.Condition()
+        self.selecting   = 0
+        self.next_select = 0
+        self.outbox      = collections.deque()
+        self.coalesce    = {}
+        self.coalesced   = 0
+        self.outbox_cond = threading.Condition()
+        self.writer      = None
+        self.recv_thread = threading.Thread(target=self._recv_thread, daemon=daemon)
 
         self.recv_thread.start()
 
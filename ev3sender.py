@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+# A Python3 class for sending EV3g Mailbox messages over kept-alive connections
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+import time
+import sys
+from ev3messages import EV3Messages
+
+class EV3Sender():
+    """
+    Class to send messages to one or more EV3s, keeping a small pool of
+    connected EV3Messages handlers per MAC address so that a Bluetooth
+    connect is only paid once rather than on every send.
+
+    The handlers run daemon threads, so an exception or Ctrl+C that skips
+    close() doesn't leave the program hanging.
+    """
+
+    class Pool():
+        """
+        Class to hold the handlers for one MAC address and port
+        """
+
+        def __init__(self, address, port, size):
+            self.address  = address
+            self.port     = port
+            self.size     = size
+            self.cond     = threading.Condition()
+            self.handlers = []
+            self.idle     = []
+
+        def acquire(self, timeout=None):
+            """
+            Take an idle handler, creating one if the pool isn't full yet
+            """
+            with self.cond:
+                while True:
+                    # Drop handlers whose receive thread has gone away
+                    for handler in [h for h in self.idle if not EV3Sender.healthy(h)]:
+                        print("{}: Replacing dead connection to {}".format(time.asctime(), self.address), file=sys.stderr)
+                        self.idle.remove(handler)
+                        self.handlers.remove(handler)
+                        EV3Sender.close_handler(handler)
+
+                    if len(self.idle) != 0:
+                        return self.idle.pop()
+
+                    if len(self.handlers) < self.size:
+                        handler = EV3Messages(self.address, self.port, daemon=True)
+                        self.handlers.append(handler)
+                        return handler
+
+                    if not self.cond.wait(timeout):
+                        raise OSError("No free connection to {}".format(self.address))
+
+        def release(self, handler):
+            """
+            Hand a handler back for the next sender
+            """
+            with self.cond:
+                self.idle.append(handler)
+                self.cond.notify()
+
+        def close(self):
+            """
+            Stop and disconnect every handler in the pool
+            """
+            with self.cond:
+                for handler in self.handlers:
+                    EV3Sender.close_handler(handler)
+                self.handlers = []
+                self.idle     = []
+
+    @staticmethod
+    def healthy(handler):
+        """
+        A handler is usable while its receive thread is running. That thread
+        disconnects the socket as soon as the link drops, and the next send
+        reconnects.
+        """
+        return handler.active and handler.recv_thread.is_alive()
+
+    @staticmethod
+    def close_handler(handler):
+        """
+        Stop the receive thread and close the socket so it exits straight away
+        """
+        handler.stop()
+        handler.disconnect()
+
+    def _pool(self, address, port):
+        """
+        Find or create the pool for an address
+        """
+        with self.lock:
+            key = (address, port)
+            if key not in self.pools:
+                self.pools[key] = EV3Sender.Pool(address, port, self.size)
+            return self.pools[key]
+
+    def warm(self, address, port=1):
+        """
+        Start connecting to an EV3 in the background, ahead of the first send
+        """
+        pool    = self._pool(address, port)
+        handler = pool.acquire(self.timeout)
+        pool.release(handler)
+
+    def _send(self, address, port, func):
+        """
+        Run func(handler) on a warm connection to address.
+
+        If the send fails the handler has already disconnected, so it is
+        retried on a fresh connection before the error is raised.
+        """
+        pool    = self._pool(address, port)
+        handler = pool.acquire(self.timeout)
+
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    return func(handler)
+                except OSError:
+                    if attempt == self.retries:
+                        raise
+                    print("{}: Send to {} failed, reconnecting".format(time.asctime(), address), file=sys.stderr)
+        finally:
+            pool.release(handler)
+
+    def send(self, address, name, value, d_type=None, port=1):
+        """
+        Send a mailbox to the EV3 at address, reusing a warm connection
+        """
+        self._send(address, port, lambda handler: handler.send(name, value, d_type))
+
+    def send_many(self, address, mailboxes, port=1):
+        """
+        Send a batch of (name, value[, d_type]) mailboxes in one write
+        """
+        mailboxes = list(mailboxes)
+        self._send(address, port, lambda handler: handler.send_many(mailboxes))
+
+    def close(self):
+        """
+        Close every connection, so the EV3s see the links closed cleanly
+        """
+        with self.lock:
+            for pool in self.pools.values():
+                pool.close()
+            self.pools = {}
+
+    def __init__(self, size=1, retries=1, timeout=None):
+        """
+        Constructor
+
+        size is the number of connections kept per EV3, retries the number of
+        reconnects tried on a failed send, and timeout how long to wait for a
+        free connection when all are busy.
+        """
+        self.size    = size
+        self.retries = retries
+        self.timeout = timeout
+        self.lock    = threading.Lock()
+        self.pools   = {}
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+# A Python3 stand-in for an EV3 brick speaking the EV3g Mailbox wire format,
+# for latency and throughput tests without the hardware
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import random
+import socket
+import threading
+import time
+import sys
+from ev3mailbox import EV3Mailbox, EV3MailboxFramer
+
+class EV3Simulator():
+    """
+    Class to play the EV3 end of a mailbox link, as
+    examples/EV3g_BT_Test.ev3 does on a real brick.
+
+    Over TCP (listen) or on any connected socket (serve, which suits
+    ev3transport.SocketPairTransport(serve=simulator.serve)) it can:
+
+      echo every mailbox it receives back unchanged (echo)
+      send a stream of generated mailboxes: rate mailboxes per second in
+      bursts of burst, names picked from names and types from types
+      ('number', 'string', 'boolean')
+      split writes so the client sees partial frames (partial is the
+      fraction of writes split), wait delay seconds plus up to jitter
+      before each write, and drop the connection after disconnect_after
+      mailboxes sent
+
+    stats() counts what happened, for checking a test's expectations.
+    """
+
+    TYPES = {
+        'number':  float,
+        'string':  str,
+        'boolean': bool,
+    }
+
+    class Connection():
+        """
+        Class to hold the state of one client connection
+        """
+
+        def __init__(self, sock):
+            self.sock   = sock
+            self.lock   = threading.Lock()
+            self.sent   = 0
+            self.closed = False
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def stats(self):
+        """
+        Counts of connections, mailboxes received, echoed and generated,
+        split writes and disconnects
+        """
+        with self.lock:
+            return dict(self.counters)
+
+    def _close(self, conn):
+        """
+        Close a connection once
+        """
+        with conn.lock:
+            if conn.closed:
+                return
+            conn.closed = True
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.sock.close()
+
+        with self.lock:
+            if conn in self.connections:
+                self.connections.remove(conn)
+
+    def drop(self):
+        """
+        Drop every open connection now, as a radio drop would
+        """
+        with self.lock:
+            connections = list(self.connections)
+        for conn in connections:
+            self._close(conn)
+            self._count('disconnects')
+
+    def _write(self, conn, payload, mailboxes, key):
+        """
+        Write mailboxes to one connection and count them under key, applying
+        the delay, split and disconnect faults. Returns False once the
+        connection is gone.
+        """
+        if self.delay > 0 or self.jitter > 0:
+            time.sleep(self.delay + self.random.uniform(0, self.jitter))
+
+        with conn.lock:
+            if conn.closed:
+                return False
+            try:
+                if self.partial > 0 and len(payload) > 1 and self.random.random() < self.partial:
+                    # Two or three pieces, with a pause so they arrive apart
+                    cuts = sorted(self.random.sample(range(1, len(payload)), min(2, len(payload) - 1)))
+                    for start, end in zip([0] + cuts, cuts + [len(payload)]):
+                        conn.sock.sendall(payload[start:end])
+                        time.sleep(0.001)
+                    self._count('split_writes')
+                else:
+                    conn.sock.sendall(payload)
+            except OSError:
+                closed = True
+            else:
+                closed = False
+                conn.sent += mailboxes
+
+        if closed:
+            self._close(conn)
+            return False
+        self._count(key, mailboxes)
+
+        if self.disconnect_after != None and conn.sent >= self.disconnect_after:
+            self._close(conn)
+            self._count('disconnects')
+            return False
+        return True
+
+    def _reader(self, conn):
+        """
+        Receive mailboxes from the client and echo them
+        """
+        framer = EV3MailboxFramer()
+        while not conn.closed:
+            try:
+                data = conn.sock.recv(4096)
+            except OSError:
+                break
+            if not data:
+                break
+
+            mailboxes = framer.feed(data)
+            self._count('received', len(mailboxes))
+            if framer.dropped != 0:
+                self._count('bad', framer.dropped)
+                framer.dropped = 0
+
+            if self.echo and len(mailboxes) != 0:
+                payload = b''.join(mailbox.payload for mailbox in mailboxes)
+                if not self._write(conn, payload, len(mailboxes), 'echoed'):
+                    break
+
+        self._close(conn)
+
+    def _generator(self, conn):
+        """
+        Send the generated stream until the connection goes
+        """
+        interval = self.burst / self.rate
+        seq      = 0
+        due      = time.monotonic()
+        while not conn.closed and self.active:
+            mailboxes = []
+            for _ in range(self.burst):
+                d_type = EV3Simulator.TYPES[self.random.choice(self.types)]
+                if d_type == float:
+                    value = float(seq)
+                elif d_type == str:
+                    value = 'msg{}'.format(seq)
+                else:
+                    value = seq % 2 == 0
+                mailboxes.append((self.random.choice(self.names), value, d_type))
+                seq += 1
+
+            if not self._write(conn, EV3Mailbox.encode_many(mailboxes), len(mailboxes), 'generated'):
+                break
+
+            due += interval
+            pause = due - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            else:
+                # Can't keep up: don't try to catch up in one go
+                due = time.monotonic()
+
+    def serve(self, sock):
+        """
+        Play the brick on an already connected socket, in background threads
+        """
+        conn = EV3Simulator.Connection(sock)
+        with self.lock:
+            self.connections.append(conn)
+            self.counters['connections'] += 1
+
+        threading.Thread(target=self._reader, args=(conn,), daemon=True).start()
+        if self.rate > 0:
+            threading.Thread(target=self._generator, args=(conn,), daemon=True).start()
+
+    def listen(self, host='127.0.0.1', port=0):
+        """
+        Accept TCP clients in a background thread. Returns the (host, port)
+        listened on; port=0 picks a free one.
+        """
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen()
+
+        def accept():
+            while self.active:
+                try:
+                    sock, _ = self.server.accept()
+                except OSError:
+                    break
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.serve(sock)
+
+        threading.Thread(target=accept, daemon=True).start()
+        return self.server.getsockname()
+
+    def close(self):
+        """
+        Stop listening and drop every connection
+        """
+        self.active = False
+        if self.server != None:
+            self.server.close()
+            self.server = None
+        with self.lock:
+            connections = list(self.connections)
+        for conn in connections:
+            self._close(conn)
+
+    def __init__(self, echo=True, rate=0, burst=1, names=('sensor',), types=('number',),
+                 partial=0.0, delay=0.0, jitter=0.0, disconnect_after=None, seed=None):
+        """
+        Constructor
+        """
+        for d_type in types:
+            if d_type not in EV3Simulator.TYPES:
+                raise ValueError('Unknown type {}'.format(d_type))
+        if burst < 1:
+            raise ValueError('burst must be at least 1')
+
+        self.echo             = echo
+        self.rate             = rate
+        self.burst            = burst
+        self.names            = list(names)
+        self.types            = list(types)
+        self.partial          = partial
+        self.delay            = delay
+        self.jitter           = jitter
+        self.disconnect_after = disconnect_after
+        self.random           = random.Random(seed)
+        self.active           = True
+        self.server           = None
+        self.lock             = threading.Lock()
+        self.connections      = []
+        self.counters         = {
+            'connections':  0,
+            'received':     0,
+            'echoed':       0,
+            'generated':    0,
+            'bad':          0,
+            'split_writes': 0,
+            'disconnects':  0,
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulate an EV3 brick over TCP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--no-echo', dest='echo', action='store_false', help="don't echo received mailboxes")
+    parser.add_argument('--rate', type=float, default=0, help='generated mailboxes per second')
+    parser.add_argument('--burst', type=int, default=1, help='generated mailboxes per write')
+    parser.add_argument('--names', default='sensor', help='comma separated mailbox names')
+    parser.add_argument('--types', default='number', help='comma separated: number,string,boolean')
+    parser.add_argument('--partial', type=float, default=0.0, help='fraction of writes split in pieces')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds before each write')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random delay, up to this')
+    parser.add_argument('--disconnect-after', type=int, default=None, help='drop after this many mailboxes')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    simulator = EV3Simulator(
+        echo=args.echo, rate=args.rate, burst=args.burst,
+        names=args.names.split(','), types=args.types.split(','),
+        partial=args.partial, delay=args.delay, jitter=args.jitter,
+        disconnect_after=args.disconnect_after, seed=args.seed,
+    )
+    host, port = simulator.listen(args.host, args.port)
+    print("{}: Simulating an EV3 on {}:{}".format(time.asctime(), host, port), file=sys.stderr)
+
+    try:
+        while True:
+            time.sleep(5)
+            print("{}: {}".format(time.asctime(), simulator.stats()), file=sys.stderr)
+    except KeyboardInterrupt:
+        simulator.close()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+# Python3 transports carrying EV3g Mailbox messages: Bluetooth RFCOMM, USB
+# serial, TCP and an in-process socket pair
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import socket
+
+class Transport():
+    """
+    Base class for a way of reaching an EV3. open() makes a new connection
+    and returns a link with three methods:
+
+        recv(size)     returns up to size bytes, b'' if the other end closed,
+                       and raises TimeoutError if nothing arrived in time
+        sendall(data)  writes all of data
+        close()
+
+    Any other failure is raised as an OSError. EV3Messages does all the
+    framing and dispatch, so a transport only moves bytes.
+    """
+
+    def open(self, timeout):
+        """
+        Connect and return a link whose recv waits at most timeout seconds
+        """
+        raise NotImplementedError
+
+    def __str__(self):
+        return type(self).__name__
+
+class RFCOMMTransport(Transport):
+    """
+    Bluetooth RFCOMM, the EV3's usual link. Uses PyBluez when installed and
+    the standard library's AF_BLUETOOTH sockets otherwise; PyBluez is only
+    imported on the first open.
+    """
+
+    class Link():
+        """
+        PyBluez socket with its timeout error mapped onto TimeoutError
+        """
+
+        def __init__(self, bt_socket, error):
+            self.bt_socket = bt_socket
+            self.error     = error
+
+        def recv(self, size):
+            try:
+                return self.bt_socket.recv(size)
+            except self.error as e:
+                if e.args and e.args[0] == "timed out":
+                    raise TimeoutError("timed out") from None
+                raise OSError(*e.args) from None
+
+        def sendall(self, data):
+            try:
+                self.bt_socket.sendall(data)
+            except self.error as e:
+                raise OSError(*e.args) from None
+
+        def close(self):
+            self.bt_socket.close()
+
+    def __init__(self, address, port=1):
+        self.address = address
+        self.port    = port
+
+    def open(self, timeout):
+        try:
+            import bluetooth
+        except ImportError:
+            bluetooth = None
+
+        if bluetooth == None:
+            if not hasattr(socket, 'AF_BLUETOOTH'):
+                raise OSError("No Bluetooth support: install PyBluez")
+            bt_socket = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
+            try:
+                bt_socket.connect((self.address, self.port))
+            except:
+                bt_socket.close()
+                raise
+            bt_socket.settimeout(timeout)
+            return bt_socket
+
+        bt_socket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+        try:
+            bt_socket.connect((self.address, self.port))
+        except bluetooth.btcommon.BluetoothError as e:
+            bt_socket.close()
+            raise OSError(*e.args) from None
+        bt_socket.settimeout(timeout)
+        return RFCOMMTransport.Link(bt_socket, bluetooth.btcommon.BluetoothError)
+
+    def __str__(self):
+        return self.address
+
+class SerialTransport(Transport):
+    """
+    USB (or any pyserial) port. port may be a device name such as COM3 or
+    /dev/ttyACM0, or a pyserial URL. pyserial is imported on the first open.
+    """
+
+    class Link():
+        """
+        Serial port with socket-like recv and sendall
+        """
+
+        def __init__(self, ser):
+            self.ser = ser
+
+        def recv(self, size):
+            data = self.ser.read(1)
+            if not data:
+                raise TimeoutError("timed out")
+            waiting = self.ser.in_waiting
+            if waiting and size > 1:
+                data += self.ser.read(min(waiting, size - 1))
+            return data
+
+        def sendall(self, data):
+            self.ser.write(data)
+            self.ser.flush()
+
+        def close(self):
+            self.ser.close()
+
+    def __init__(self, port, baudrate=57600):
+        self.port     = port
+        self.baudrate = baudrate
+
+    def open(self, timeout):
+        import serial
+        try:
+            ser = serial.serial_for_url(self.port, self.baudrate, timeout=timeout)
+        except serial.SerialException as e:
+            raise OSError(str(e)) from None
+        return SerialTransport.Link(ser)
+
+    def __str__(self):
+        return self.port
+
+class TCPTransport(Transport):
+    """
+    TCP connection, e.g. to a bridge or to ev3simulator
+    """
+
+    def __init__(self, host, port, connect_timeout=10):
+        self.host            = host
+        self.port            = port
+        self.connect_timeout = connect_timeout
+
+    def open(self, timeout):
+        sock = socket.create_connection((self.host, self.port), self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(timeout)
+        return sock
+
+    def __str__(self):
+        return '{}:{}'.format(self.host, self.port)
+
+class SocketPairTransport(Transport):
+    """
+    In-process link over socket.socketpair(), for tests and benchmarks
+    without any network. Each open() makes a new pair; the other end is
+    handed to serve(sock) if given (e.g. a simulator thread) and kept in
+    peer.
+    """
+
+    def __init__(self, serve=None):
+        self.serve = serve
+        self.peer  = None
+
+    def open(self, timeout):
+        ours, theirs = socket.socketpair()
+        ours.settimeout(timeout)
+        self.peer = theirs
+        if self.serve != None:
+            self.serve(theirs)
+        return ours
+
+    def __str__(self):
+        return 'socketpair'
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import asyncio
+import sys
+
+sys.path.append('..')
+from ev3async import EV3AsyncMessages
+
+# Change to your MAC addresses - every EV3 is served by the same event loop
+ADDRESSES = ['00:16:53:4F:AF:E7']
+
+async def _recv_task(handler, name):
+    async for msg in handler.subscribe(name):
+        print("{} {}: Got message {}".format(handler.address, name, msg), file=sys.stderr)
+
+    print("Stopping task {}".format(name), file=sys.stderr)
+
+async def _send_task(handler):
+    i = 0
+    while handler.active == True:
+        try:
+            if i%10 == 0:
+                await handler.send("boolean", True if i%20==0 else False)
+            if i%15 == 0:
+                await handler.send("number", i/2)
+            if i%9 == 0:
+                await handler.send("string", "i={}".format(i))
+        except Exception as e:
+            print("Failed to send - {}. Trying again".format(e), file=sys.stderr)
+        await asyncio.sleep(1)
+        i+=1
+
+async def _brick(address):
+    handler = EV3AsyncMessages(address)
+
+    tasks = [asyncio.ensure_future(_recv_task(handler, name))
+             for name in ("number", "string", "boolean")]
+    tasks.append(asyncio.ensure_future(_send_task(handler)))
+
+    msg = await handler.get("quit")
+    print("{} quit: Got message {}".format(address, msg), file=sys.stderr)
+    await handler.close()
+    await asyncio.gather(*tasks)
+
+async def main():
+    await asyncio.gather(*[_brick(address) for address in ADDRESSES])
+
+print("Starting main")
+asyncio.run(main())
+print("Ending main")
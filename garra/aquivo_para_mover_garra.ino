@@ -22,29 +22,32 @@ void setup() {
   garra.write(120);
   delay(500);
 
-  pegarObjeto();
-  colocarNaEsteira();
-  voltarParaPosicaoInicial();
-
-  Serial.println("\nComando recebido! Iniciando a sequência de movimentos...");
+  // Só posiciona o braço: a sequência agora roda quando chega o comando
+  // "start", e a porta serial fica aberta entre um comando e outro
+  Serial.println("PRONTO");
 }
 
 void loop() {
-  // if (Serial.available() > 0) {
-  //   while (Serial.available() > 0) {
-  //     Serial.read();
-  //   }
-
-  //   Serial.println("\nComando recebido! Iniciando a sequência de movimentos...");
-
-  //   pegarObjeto();
-  //   colocarNaEsteira();
-  //   voltarParaPosicaoInicial();
-
-  //   Serial.println("\nSequência concluída.");
-  //   Serial.println("Aguardando novo comando...");
-  //   Serial.println("----------------------------------------------------");
-  // }
+  if (Serial.available() > 0) {
+    String comando = Serial.readStringUntil('\n');
+    comando.trim();
+
+    if (comando == "start") {
+      Serial.println("\nComando recebido! Iniciando a sequência de movimentos...");
+
+      pegarObjeto();
+      colocarNaEsteira();
+      voltarParaPosicaoInicial();
+
+      Serial.println("\nSequência concluída.");
+      Serial.println("OK start");
+    } else if (comando == "ping") {
+      Serial.println("OK ping");
+    } else if (comando.length() > 0) {
+      Serial.print("ERRO comando desconhecido: ");
+      Serial.println(comando);
+    }
+  }
 }
 
 /**
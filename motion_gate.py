@@ -0,0 +1,118 @@
+import threading
+import time
+import cv2
+
+
+class MotionGate:
+    """
+    Porta barata na frente do detector: só deixa rodar o ORB + busca quando
+    a cena mudou.
+
+    Cada frame é reduzido para uma miniatura em cinza (size) e comparado com
+    a miniatura do último frame analisado. Se a fração de pixels que mudaram
+    mais que threshold níveis de cinza passar de min_area, há movimento e o
+    detector roda na hora, sem atraso. Com a cena parada o resultado anterior
+    é repetido. Depois de um movimento o detector ainda roda por settle
+    frames, para o resultado repetido não ser o de um frame borrado, e a cada
+    max_skip frames pulados ele roda de novo de qualquer jeito (luz mudando
+    devagar).
+
+    hold(until) pula a detecção até o instante until (enquanto o resultado
+    está na tela e seria jogado fora); quando o prazo acaba o próximo frame
+    é sempre analisado.
+    """
+
+    def __init__(self, size=(80, 60), threshold=15, min_area=0.005, settle=2, max_skip=30):
+        self.size = size
+        self.threshold = threshold
+        self.min_area = min_area
+        self.settle = settle
+        self.max_skip = max_skip
+
+        self.lock = threading.Lock()
+        self.reference = None
+        self.pending = 0
+        self.skipped_in_row = 0
+        self.hold_until = None
+        self.last_result = None
+
+        self.counters = {
+            'frames': 0,
+            'detected': 0,
+            'skipped_static': 0,
+            'skipped_hold': 0,
+        }
+
+    def _thumbnail(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def hold(self, until):
+        """
+        Pula a detecção até o instante until (time.time())
+        """
+        with self.lock:
+            self.hold_until = until
+
+    def should_detect(self, frame):
+        """
+        True se o frame precisa passar pelo detector
+        """
+        now = time.time()
+        thumb = self._thumbnail(frame)
+
+        with self.lock:
+            self.counters['frames'] += 1
+
+            if self.hold_until is not None:
+                if now < self.hold_until:
+                    self.counters['skipped_hold'] += 1
+                    return False
+                # Fim da exibição: começa de novo a partir deste frame
+                self.hold_until = None
+                self.reference = None
+
+            if self.reference is None:
+                moved = True
+            else:
+                diff = cv2.absdiff(thumb, self.reference)
+                changed = cv2.countNonZero(cv2.threshold(
+                    diff, self.threshold, 255, cv2.THRESH_BINARY)[1])
+                moved = changed >= self.min_area * thumb.size
+
+            if moved:
+                self.pending = self.settle
+            elif self.pending > 0:
+                self.pending -= 1
+            elif self.skipped_in_row < self.max_skip:
+                self.skipped_in_row += 1
+                self.counters['skipped_static'] += 1
+                return False
+
+            self.reference = thumb
+            self.skipped_in_row = 0
+            self.counters['detected'] += 1
+            return True
+
+    def wrap(self, detect, empty=None):
+        """
+        Devolve um detect(frame) que só chama o original quando
+        should_detect deixa; nos outros frames repete o último resultado
+        (ou empty se ainda não houver nenhum)
+        """
+        def gated(frame):
+            if self.should_detect(frame):
+                result = detect(frame)
+                with self.lock:
+                    self.last_result = result
+                return result
+            with self.lock:
+                return empty if self.last_result is None else self.last_result
+
+        return gated
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
@@ -0,0 +1,191 @@
+import threading
+import time
+import cv2
+from descriptor_cache import orb_params
+
+# Degraus de qualidade, do melhor para o mais leve: (escala do frame,
+# fração do nfeatures e fração do nlevels do ORB das referências). O
+# primeiro é sempre o próprio ORB das referências; com o ORB padrão (500
+# features, 8 níveis) os degraus são 500/8, 350/8, 350/6, 250/6 e 250/4.
+DEFAULT_LEVELS = (
+    (1.0, 1.0, 1.0),
+    (1.0, 0.7, 1.0),
+    (0.75, 0.7, 0.75),
+    (0.75, 0.5, 0.75),
+    (0.5, 0.5, 0.5),
+)
+
+
+class QualityController:
+    """
+    Ajusta a qualidade da detecção para caber no tempo de um frame.
+
+    Mede quanto tempo leva cada detecção completa (ORB + busca nas
+    referências) e mantém uma média móvel. Depois de min_samples medidas no
+    degrau atual, desce um degrau de levels quando a média passa do
+    orçamento de 1/target_fps e sobe um degrau quando sobra folga (média
+    abaixo de headroom x orçamento por up_wait detecções seguidas). Se
+    subir e logo em seguida ter que descer de novo, o tempo de espera para a
+    próxima subida dobra, para não ficar oscilando.
+
+    Só mudam a escala do frame, nfeatures e nlevels, estes dois como frações
+    dos do ORB das referências: o degrau 0 é exatamente esse ORB. Os outros
+    parâmetros do ORB (scaleFactor, WTA_K, patchSize, ...) são sempre os do
+    ORB que gerou os descritores das referências, então os descritores do
+    frame continuam comparáveis com os do cache. As posições dos keypoints
+    são devolvidas já na escala do frame original.
+
+    A pontuação (boas correspondências / descritores da referência) cai
+    muito num degrau mais leve se o frame for comparado com referências
+    calculadas no degrau 0. Por isso, com references(orb, escala) ->
+    ReferenceIndex, cada degrau tem o seu índice com as referências
+    reduzidas na mesma escala e com o mesmo ORB do frame, e
+    make_extractor(with_index=True) devolve junto o índice do degrau usado.
+    """
+
+    def __init__(self, reference_orb, target_fps=15.0, levels=DEFAULT_LEVELS,
+                 alpha=0.2, headroom=0.6, min_samples=5, up_wait=30, max_up_wait=480,
+                 references=None):
+        self.params = orb_params(reference_orb)
+        self.target_fps = target_fps
+        self.budget = 1.0 / target_fps
+        levels = tuple(levels)
+        if not levels or tuple(levels[0]) != (1.0, 1.0, 1.0):
+            raise ValueError("O primeiro degrau precisa ser (1.0, 1.0, 1.0): o ORB das referências")
+        # Degraus em valores absolutos: (escala, nfeatures, nlevels)
+        nfeatures, nlevels = self.params[0], self.params[2]
+        self.levels = tuple(
+            (scale, max(1, round(nfeatures * features)), max(1, round(nlevels * pyramid)))
+            for scale, features, pyramid in levels
+        )
+        self.alpha = alpha
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.min_up_wait = up_wait
+        self.max_up_wait = max_up_wait
+
+        self.lock = threading.Lock()
+        self.level = 0
+        self.average = None
+        self.samples = 0
+        self.calm = 0
+        self.up_wait = up_wait
+        self.last_change = None
+        self.changes = 0
+
+        # Um índice de referências por degrau, já calculados (ficam no cache
+        # de descritores, então só a primeira execução paga o ORB)
+        self.indexes = None
+        if references is not None:
+            self.indexes = [references(self._make_orb(level), scale)
+                            for level, (scale, _, _) in enumerate(self.levels)]
+
+    def _make_orb(self, level):
+        (_, scale_factor, _, edge_threshold, first_level,
+         wta_k, score_type, patch_size, fast_threshold) = self.params
+        _, nfeatures, nlevels = self.levels[level]
+        return cv2.ORB_create(nfeatures, scale_factor, nlevels, edge_threshold,
+                              first_level, wta_k, score_type, patch_size, fast_threshold)
+
+    def settings(self):
+        """
+        Configuração atual e o tempo médio medido por detecção
+        """
+        with self.lock:
+            scale, nfeatures, nlevels = self.levels[self.level]
+            return {
+                'level': self.level,
+                'scale': scale,
+                'nfeatures': nfeatures,
+                'nlevels': nlevels,
+                'frame_ms': None if self.average is None else self.average * 1000,
+                'target_fps': self.target_fps,
+                'changes': self.changes,
+            }
+
+    def record(self, seconds):
+        """
+        Registra o tempo de uma detecção e troca de degrau se for preciso
+        """
+        with self.lock:
+            if self.average is None:
+                self.average = seconds
+            else:
+                self.average += self.alpha * (seconds - self.average)
+            self.samples += 1
+            if self.samples < self.min_samples:
+                return
+
+            if self.average > self.budget and self.level < len(self.levels) - 1:
+                if self.last_change == 'up':
+                    # Acabou de subir e não coube: espera mais antes de tentar de novo
+                    self.up_wait = min(self.up_wait * 2, self.max_up_wait)
+                self._change(+1)
+            elif self.average < self.headroom * self.budget and self.level > 0:
+                self.calm += 1
+                if self.calm >= self.up_wait:
+                    self._change(-1)
+            else:
+                self.calm = 0
+                if self.last_change == 'up':
+                    # A subida coube no orçamento
+                    self.up_wait = self.min_up_wait
+                    self.last_change = None
+
+    def _change(self, step):
+        self.level += step
+        self.last_change = 'down' if step > 0 else 'up'
+        self.changes += 1
+        self.calm = 0
+        # Média recomeça no novo degrau
+        self.average = None
+        self.samples = 0
+        scale, nfeatures, nlevels = self.levels[self.level]
+        print(f"[INFO] Qualidade da detecção: escala {scale}, nfeatures {nfeatures}, nlevels {nlevels}")
+
+    def make_extractor(self, with_index=False):
+        """
+        Devolve extract(gray) -> (keypoints, descritores) para uma thread de
+        detecção, com o seu próprio ORB refeito quando o degrau muda. Com
+        with_index=True devolve (keypoints, descritores, índice do degrau)
+        (precisa de references no construtor).
+        """
+        if with_index and self.indexes is None:
+            raise ValueError("with_index precisa de references no QualityController")
+
+        current = {'level': None, 'orb': None}
+
+        def extract(gray):
+            with self.lock:
+                level = self.level
+            if level != current['level']:
+                current['level'] = level
+                current['orb'] = self._make_orb(level)
+
+            scale = self.levels[level][0]
+            if scale != 1.0:
+                small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            else:
+                small = gray
+            keypoints, descriptors = current['orb'].detectAndCompute(small, None)
+            if scale != 1.0:
+                keypoints = [cv2.KeyPoint(kp.pt[0] / scale, kp.pt[1] / scale, kp.size / scale,
+                                          kp.angle, kp.response, kp.octave, kp.class_id)
+                             for kp in keypoints]
+            if with_index:
+                return keypoints, descriptors, self.indexes[level]
+            return keypoints, descriptors
+
+        return extract
+
+    def wrap(self, detect):
+        """
+        Devolve detect(...) medindo o tempo de cada chamada com record()
+        """
+        def timed(*args):
+            start = time.perf_counter()
+            result = detect(*args)
+            self.record(time.perf_counter() - start)
+            return result
+
+        return timed
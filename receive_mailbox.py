@@ -1,15 +1,5 @@
-import bluetooth
-import struct
-from ev3mailbox import EV3Mailbox
-
-def recv_all(sock, size):
-    data = b''
-    while len(data) < size:
-        more = sock.recv(size - len(data))
-        if not more:
-            raise ConnectionError("Conexão encerrada inesperadamente.")
-        data += more
-    return data
+from ev3mailbox import EV3MailboxFramer
+from ev3transport import RFCOMMTransport, TCPTransport
 
 def format_value(value):
     """
@@ -23,44 +13,38 @@ def format_value(value):
 EV3_MAC = '00:16:53:82:0E:20'
 PORT = 1
 
-sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-sock.connect((EV3_MAC, PORT))
+# Para testar sem o EV3: rode "python ev3simulator.py --rate 20" e use
+# SIMULADOR = ('127.0.0.1', 5000)
+SIMULADOR = None
+
+transport = TCPTransport(*SIMULADOR) if SIMULADOR else RFCOMMTransport(EV3_MAC, PORT)
+sock = transport.open(None)
 print("Conectado ao EV3, aguardando mensagens...")
 
+# Um recv pode trazer várias mensagens ou só parte de uma; o framer junta os pedaços
+framer = EV3MailboxFramer()
+
 try:
     while True:
-        # Lê os 2 primeiros bytes do header
-        header = recv_all(sock, 2)
-        size = int.from_bytes(header, byteorder='little')
-        print(f"[DEBUG] Tamanho esperado: {size} bytes")
+        data = sock.recv(1024)
+        if not data:
+            raise ConnectionError("Conexão encerrada inesperadamente.")
+        print(f"[DEBUG] Bytes recebidos: {len(data)}")
 
-        # Lê o corpo da mensagem
-        body = recv_all(sock, size - 2)
-        payload = header + body
+        dropped = framer.dropped
+        for mailbox in framer.feed(data):
+            print("[DEBUG] Payload bruto:", mailbox.raw_bytes())
 
-        print(f"[DEBUG] Bytes recebidos: {len(payload)}")
-        print("[DEBUG] Payload bruto:", ' '.join(f'{b:02x}' for b in payload))
+            # Formata o valor para exibição
+            value, tipo = format_value(mailbox.value)
 
-        # Decodificação robusta com padding automático
-        try:
-            mailbox = EV3Mailbox.decode(payload)
-        except struct.error as e:
-            if "unpack_from requires a buffer of at least" in str(e):
-                print("[WARN] Payload incompleto. Aplicando padding com 0x00...")
-                expected_len = int(str(e).split("at least ")[1].split(" ")[0])
-                padding_needed = expected_len - len(payload)
-                payload += b'\x00' * padding_needed
-                mailbox = EV3Mailbox.decode(payload)
+            if isinstance(value, str):
+                print(f"[RECEBIDO] {mailbox.name} = \"{value}\" (tipo: {tipo})")
             else:
-                raise
-
-        # Formata o valor para exibição
-        value, tipo = format_value(mailbox.value)
+                print(f"[RECEBIDO] {mailbox.name} = {value} (tipo: {tipo})")
 
-        if isinstance(value, str):
-            print(f"[RECEBIDO] {mailbox.name} = \"{value}\" (tipo: {tipo})")
-        else:
-            print(f"[RECEBIDO] {mailbox.name} = {value} (tipo: {tipo})")
+        if framer.dropped != dropped:
+            print(f"[WARN] Mensagem inválida descartada: {framer.error}")
 
 except KeyboardInterrupt:
     print("\nEncerrado pelo usuário.")
@@ -0,0 +1,156 @@
+import re
+import cv2
+import numpy as np
+
+# Razão do teste de Lowe, a mesma de match_and_score
+RATIO = 0.75
+
+
+def ratio_matches(des_ref, des_frame):
+    """
+    Teste da razão vetorizado: máscara booleana com True para cada descritor
+    de referência cujo vizinho mais próximo no frame é bem melhor que o
+    segundo. cv2.batchDistance devolve as 2 menores distâncias de todos os
+    descritores de uma vez em arrays, sem passar por objetos DMatch.
+    """
+    return nearest_matches(des_ref, des_frame)[0]
+
+
+def nearest_matches(des_ref, des_frame):
+    """
+    Como ratio_matches, mas devolve também o índice (no frame) do vizinho
+    mais próximo de cada descritor de referência
+    """
+    if des_ref is None or len(des_ref) == 0:
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=np.intp)
+    if des_frame is None or len(des_frame) < 2:
+        # Sem segundo vizinho não há teste da razão (o knnMatch também descartava)
+        return np.zeros(len(des_ref), dtype=bool), np.full(len(des_ref), -1, dtype=np.intp)
+
+    dist, nidx = cv2.batchDistance(des_ref, des_frame, cv2.CV_32S,
+                                   normType=cv2.NORM_HAMMING, K=2)
+    return dist[:, 0] < RATIO * dist[:, 1], nidx[:, 0]
+
+
+def class_name(ref_name):
+    """
+    Classe do objeto a partir do nome da referência: 'bala2' -> 'bala'
+    """
+    return re.sub(r'\d+$', '', ref_name)
+
+
+class ReferenceIndex:
+    """
+    Índice único com os descritores de todas as referências empilhados e um
+    array de rótulos (qual referência gerou cada linha).
+
+    Em vez de um knnMatch por referência, cada frame faz uma só busca do
+    índice inteiro contra os descritores do frame. Cada descritor de
+    referência continua procurando seus 2 vizinhos no frame, então as
+    pontuações são as mesmas do laço com match_and_score, só que sem o custo
+    de N chamadas por frame. O teste da razão e as somas por referência e
+    por classe são feitos com arrays NumPy.
+    """
+
+    def __init__(self, refs):
+        self.names = [ref['name'] for ref in refs]
+        self.classes = sorted(set(class_name(name) for name in self.names))
+        self.ref_class = np.array(
+            [self.classes.index(class_name(name)) for name in self.names], dtype=np.intp
+        )
+
+        blocks = []
+        labels = []
+        for i, ref in enumerate(refs):
+            des = ref['descriptors']
+            if des is None or len(des) == 0:
+                continue
+            blocks.append(np.asarray(des, dtype=np.uint8))
+            labels.append(np.full(len(des), i, dtype=np.intp))
+
+        if blocks:
+            self.descriptors = np.ascontiguousarray(np.vstack(blocks))
+            self.labels = np.concatenate(labels)
+        else:
+            self.descriptors = np.empty((0, 32), dtype=np.uint8)
+            self.labels = np.empty(0, dtype=np.intp)
+
+        # Quantidade de descritores de cada referência (o len(des_ref) do score)
+        # e de cada classe (todas as vistas do mesmo objeto somadas)
+        self.counts = np.bincount(self.labels, minlength=len(self.names))
+        self.class_counts = np.bincount(self.ref_class, weights=self.counts,
+                                        minlength=len(self.classes))
+
+    def __len__(self):
+        return len(self.names)
+
+    def good_matches(self, des_frame):
+        """
+        Quantidade de matches bons (teste da razão) por referência
+        """
+        good = ratio_matches(self.descriptors, des_frame)
+        return np.bincount(self.labels[good], minlength=len(self.names))
+
+    def scores(self, des_frame, good=None):
+        """
+        Pontuação (%) de cada referência para o frame, na ordem de names
+        """
+        if good is None:
+            good = self.good_matches(des_frame)
+        return np.divide(good * 100.0, self.counts,
+                         out=np.zeros(len(self.names)), where=self.counts > 0)
+
+    def class_scores(self, scores):
+        """
+        Melhor pontuação de cada classe, na ordem de classes
+        """
+        best = np.zeros(len(self.classes))
+        np.maximum.at(best, self.ref_class, scores)
+        return best
+
+    def pooled_scores(self, good):
+        """
+        Pontuação (%) de cada classe juntando todas as suas vistas: matches
+        bons de bala, bala2, ... sobre o total de descritores dessas vistas
+        """
+        class_good = np.bincount(self.ref_class, weights=good, minlength=len(self.classes))
+        return np.divide(class_good * 100.0, self.class_counts,
+                         out=np.zeros(len(self.classes)), where=self.class_counts > 0)
+
+    def best(self, des_frame):
+        """
+        (nome, pontuação) da referência com maior pontuação no frame
+        """
+        return self._best(self.names, self.scores(des_frame))
+
+    def best_class(self, des_frame):
+        """
+        (classe, pontuação agrupada) da classe com maior pontuação no frame
+        """
+        return self._best(self.classes, self.pooled_scores(self.good_matches(des_frame)))
+
+    def best_with_points(self, des_frame, by_class=False):
+        """
+        Como best (ou best_class, com by_class) e também os índices dos
+        keypoints do frame que casaram com a referência (ou classe) vencedora,
+        para um rastreador seguir o objeto a partir deles
+        """
+        good, nidx = nearest_matches(self.descriptors, des_frame)
+        counts = np.bincount(self.labels[good], minlength=len(self.names))
+        if by_class:
+            names, scores, owner = self.classes, self.pooled_scores(counts), self.ref_class[self.labels]
+        else:
+            names, scores, owner = self.names, self.scores(des_frame, counts), self.labels
+
+        name, score = self._best(names, scores)
+        if score <= 0:
+            return name, score, np.zeros(0, dtype=np.intp)
+        winner = names.index(name)
+        return name, score, np.unique(nidx[good & (owner == winner)])
+
+    @staticmethod
+    def _best(names, scores):
+        if len(scores) == 0 or scores.max() <= 0:
+            return '—', 0.0
+        i = int(np.argmax(scores))
+        return names[i], float(scores[i])
@@ -1,31 +1,180 @@
 #!/usr/bin/env python3
 """
-Script simples para enviar comando 'start' via porta serial
+Driver da porta serial do Arduino (garra/aquivo_para_mover_garra.ino) e
+script simples para enviar o comando 'start'
 """
-import serial
+import queue
+import threading
 import time
+from concurrent.futures import CancelledError, Future
+
+import serial
 
 
-def send_start_command(port="COM3", baudrate=9600):
+class ArduinoDriver:
     """
-    Função para enviar comando 'start' pela porta serial
+    Mantém a porta serial do Arduino aberta entre comandos.
+
+    Abrir a porta reinicia a placa, então a espera pela estabilização só
+    acontece na primeira abertura (ou numa reconexão): o driver espera a
+    linha de pronto do sketch (ready) por até settle segundos.
+
+    send() envia um comando e, se ack for dado, lê as linhas de resposta até
+    uma que contenha ack. submit() coloca o comando numa fila atendida por
+    uma thread e devolve um Future com as linhas lidas.
+
+    port pode ser o nome da porta (COM3, /dev/ttyACM0, um pty) ou uma URL
+    do pyserial (loop://, socket://...).
+
+    cancel() interrompe a espera por uma confirmação (em até timeout
+    segundos) e faz os próximos send() falharem na hora, até o close().
     """
-    try:
-        # Conectar à porta serial
-        ser = serial.Serial(port, baudrate, timeout=1)
-        print(f"Conectado à porta {port}")
 
-        # Aguardar estabilização
-        time.sleep(0.5)
+    def __init__(self, port="COM3", baudrate=9600, timeout=1, settle=2.0, ready="PRONTO"):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.settle = settle
+        self.ready = ready
+        self.ser = None
+        self.lock = threading.Lock()
+        self.commands = queue.Queue()
+        self.worker = None
+        self.cancelled = threading.Event()
+
+    def open(self):
+        """
+        Abre a porta (se ainda não estiver aberta) e espera a placa ficar pronta
+        """
+        with self.lock:
+            self._open()
+
+    def _open(self):
+        if self.ser is not None:
+            return
+        self.ser = serial.serial_for_url(self.port, self.baudrate, timeout=self.timeout)
+        print(f"Conectado à porta {self.port}")
+
+        # Aguardar estabilização (o sketch avisa quando terminou o setup;
+        # com um sketch antigo, sem o aviso, a espera dura o settle inteiro)
+        if self.ready:
+            try:
+                self._read_until(self.ready, self.settle)
+            except TimeoutError:
+                pass
+        else:
+            time.sleep(self.settle)
+        self.ser.reset_input_buffer()
+
+    def cancel(self):
+        """
+        Desiste do comando em andamento e dos próximos (CancelledError), por
+        exemplo para sair sem esperar a garra terminar
+        """
+        self.cancelled.set()
 
-        # Enviar comando 'start'
-        command = "start\n"
-        ser.write(command.encode("utf-8"))
-        print("Comando 'start' enviado")
+    def close(self):
+        """
+        Termina os comandos da fila e fecha a porta
+        """
+        if self.worker is not None:
+            self.commands.put(None)
+            self.worker.join()
+            self.worker = None
+        with self.lock:
+            self._close()
+        self.cancelled.clear()
 
-        # Fechar conexão
-        ser.close()
-        print("Conexão fechada")
+    def _close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except serial.SerialException:
+                pass
+            self.ser = None
+            print("Conexão fechada")
+
+    def _read_until(self, ack, timeout):
+        """
+        Lê linhas até uma que contenha ack ou até acabar o tempo
+        """
+        lines = []
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.cancelled.is_set():
+                raise CancelledError(f"Espera por '{ack}' cancelada")
+            raw = self.ser.readline()
+            if not raw:
+                continue
+            line = raw.decode("utf-8", errors="replace").strip()
+            lines.append(line)
+            if ack in line:
+                return lines
+        raise TimeoutError(f"Sem resposta '{ack}' do Arduino em {timeout} s")
+
+    def send(self, command, ack=None, ack_timeout=60.0):
+        """
+        Envia um comando (uma linha). Se ack for dado, devolve as linhas lidas
+        até a confirmação. Se a porta tiver caído, reabre e tenta de novo.
+        """
+        with self.lock:
+            if self.cancelled.is_set():
+                raise CancelledError(f"Comando '{command}' cancelado")
+            for attempt in range(2):
+                try:
+                    self._open()
+                    self.ser.write((command + "\n").encode("utf-8"))
+                    self.ser.flush()
+                    break
+                except serial.SerialException:
+                    self._close()
+                    if attempt == 1:
+                        raise
+            print(f"Comando '{command}' enviado")
+
+            if ack is None:
+                return None
+            return self._read_until(ack, ack_timeout)
+
+    def submit(self, command, ack=None, ack_timeout=60.0):
+        """
+        Coloca o comando na fila e volta na hora, com um Future do resultado
+        """
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._worker, daemon=True)
+            self.worker.start()
+        future = Future()
+        self.commands.put((future, command, ack, ack_timeout))
+        return future
+
+    def _worker(self):
+        while True:
+            item = self.commands.get()
+            if item is None:
+                break
+            future, command, ack, ack_timeout = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.send(command, ack, ack_timeout))
+            except Exception as e:
+                future.set_exception(e)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def send_start_command(port="COM3", baudrate=9600):
+    """
+    Função para enviar comando 'start' pela porta serial
+    """
+    try:
+        with ArduinoDriver(port, baudrate) as arduino:
+            arduino.send("start")
 
     except serial.SerialException as e:
         print(f"Erro na comunicação serial: {e}")
@@ -38,4 +187,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,183 +1,343 @@
 import os
 import time
+from concurrent.futures import CancelledError
 import cv2
-import bluetooth
-from ev3mailbox import EV3Mailbox
-import subprocess  # Para rodar o arquivo send_arduino.py
+import numpy as np
+from ev3sender import EV3Sender
+from descriptor_cache import DescriptorCache, clone_orb
+from reference_index import ReferenceIndex, ratio_matches
+from vision_pipeline import VisionPipeline
+from actuation import ActuationDispatcher
+from motion_gate import MotionGate
+from tracker import ObjectTracker
+from quality_controller import QualityController
+from detection_pool import DetectionPool
+from send_arduino import ArduinoDriver
 
 # Caminho da pasta com as imagens de referência
 PATH_IMAGES = 'C:\\Users\\weste\\Documents\\test\\ev3-mailbox-python\\captured_images'
 
+# Subpasta (dentro da pasta de imagens) onde ficam os descritores em cache
+CACHE_DIRNAME = '.orb_cache'
+
 # Limiar mínimo de similaridade para considerar uma detecção (em %)
 MIN_DISPLAY_SCORE = 10.0  # agora em 25%
 
+# Se True, a pontuação é por classe juntando todas as vistas (bala, bala2, ...)
+# em vez da melhor imagem isolada
+SCORE_BY_CLASS = False
+
 # Número mínimo de frames consecutivos com detecção válida
 MIN_CONSECUTIVE_FRAMES = 5
 
+# Threads de detecção do modo pipeline (captura, detecção e exibição em
+# paralelo); 0 volta ao laço sequencial de uma thread só
+PIPELINE_WORKERS = 1
+
+# Processos de detecção, para usar todos os núcleos (os frames passam por
+# memória compartilhada). Com mais de 0, substitui as threads de
+# PIPELINE_WORKERS, e a porta de movimento, o rastreamento e o controle de
+# qualidade (que rodam nas threads) ficam desligados
+PROCESS_WORKERS = 0
+
+# Se True, o ORB só roda quando a cena muda (ou quando acaba a exibição do
+# resultado); com a cena parada o último resultado é repetido
+MOTION_GATE = True
+
+# Se True, depois de confirmado o objeto é seguido com fluxo óptico e a busca
+# completa nas referências só roda a cada REID_EVERY frames (ou se perder o objeto)
+TRACK_AFTER_DETECT = True
+REID_EVERY = 15
+
+# Se True, a escala do frame, o nfeatures e o nlevels do ORB são ajustados
+# sozinhos para a detecção caber em TARGET_FPS quadros por segundo
+ADAPTIVE_QUALITY = True
+TARGET_FPS = 15.0
+
+# Número enviado ao EV3 para cada classe de objeto
+CLASS_CODES = {'quadrado': 0, 'bala': 1, 'peao': 2}
+
 # Tempo em segundos para manter o resultado na tela
 DISPLAY_DURATION = 5.0
 
+# Porta serial do Arduino da garra
+ARDUINO_PORT = 'COM3'
+
+# Conexões Bluetooth mantidas abertas entre envios (reconecta sozinho se cair)
+sender = EV3Sender()
+
+# Porta do Arduino aberta uma vez só (abrir a porta reinicia a placa)
+arduino = ArduinoDriver(ARDUINO_PORT)
+
 # Função para enviar número para o EV3
 def enviar_numero_ev3(mac_address, mailbox_name, numero, porta=1):
     try:
-        sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-        sock.connect((mac_address, porta))
-        print(f"[OK] Conectado ao EV3: {mac_address}")
-
-        mensagem = EV3Mailbox.encode(mailbox_name, float(numero))  # força float
-        sock.send(mensagem.payload)
+        sender.send(mac_address, mailbox_name, float(numero), port=porta)  # força float
         print(f"[ENVIADO] {mailbox_name} = {numero} (tipo: {type(numero).__name__})")
 
     except Exception as e:
         print(f"[ERRO] Falha ao enviar: {e}")
 
-    finally:
-        sock.close()
-        print("[INFO] Conexão Bluetooth encerrada.")
-
 # Função para carregar as imagens de referência
-def load_reference_images(path):
-    orb = cv2.ORB_create()
+# Keypoints e descritores ficam em cache no disco (por padrão em <path>/.orb_cache),
+# então só imagens novas ou alteradas passam pelo detectAndCompute.
+# orb e scale permitem calcular as referências de um degrau do controle de
+# qualidade; com um cache compartilhado, quem o criou chama o prune()
+def load_reference_images(path, cache_dir=None, orb=None, scale=1.0, cache=None):
+    orb = orb or cv2.ORB_create()
+    own_cache = cache is None
+    if own_cache:
+        cache = DescriptorCache(cache_dir or os.path.join(path, CACHE_DIRNAME))
+    hits, misses = cache.hits, cache.misses
     refs = []
-    for filename in os.listdir(path):
+    for filename in sorted(os.listdir(path)):
         filepath = os.path.join(path, filename)
-        img = cv2.imread(filepath, cv2.IMREAD_GRAYSCALE)
-        if img is None:
+        if not os.path.isfile(filepath):
+            continue
+        result = cache.compute(filepath, orb, scale)
+        if result is None:
             continue
-        kp, des = orb.detectAndCompute(img, None)
+        keypoints, des = result
         refs.append({
             'name': os.path.splitext(filename)[0],
+            'keypoints': keypoints,
             'descriptors': des
         })
+    if own_cache:
+        cache.prune()
+    print(f"[INFO] {len(refs)} referências carregadas ({cache.hits - hits} do cache, "
+          f"{cache.misses - misses} calculadas)")
     return refs, orb
 
 # Função para comparar e calcular a pontuação
-def match_and_score(des_ref, des_frame, matcher):
+# (matcher ficou só por compatibilidade: as distâncias vêm em lote do ratio_matches)
+def match_and_score(des_ref, des_frame, matcher=None):
     if des_ref is None or des_frame is None or len(des_ref) == 0:
         return 0.0, 0
-    matches = matcher.knnMatch(des_ref, des_frame, k=2)
-    good = []
-    for pair in matches:
-        if len(pair) < 2:
-            continue
-        m, n = pair
-        if m.distance < 0.75 * n.distance:
-            good.append(m)
-    score = (len(good) / len(des_ref)) * 100
-    return score, len(good)
-
-# Função para rodar o script send_arduino.py
-def run_send_arduino_script():
+    good = int(np.count_nonzero(ratio_matches(des_ref, des_frame)))
+    score = (good / len(des_ref)) * 100
+    return score, good
+
+# Função para mandar a garra rodar a sequência e esperar ela terminar
+def enviar_comando_arduino(comando='start'):
     try:
-        subprocess.run(['python', 'C:\\Users\\weste\\Documents\\test\\ev3-mailbox-python\\send_arduino.py'], check=True)
-        print("Comando 'start' enviado ao Arduino com sucesso!")
-    except subprocess.CalledProcessError as e:
-        print(f"Erro ao rodar o script send_arduino.py: {e}")
+        arduino.send(comando, ack=f'OK {comando}', ack_timeout=60.0)
+        print(f"Comando '{comando}' executado pelo Arduino com sucesso!")
+    except TimeoutError as e:
+        print(f"[ERRO] {e}")
+    except CancelledError as e:
+        print(f"[INFO] {e}")
     except Exception as e:
-        print(f"Erro inesperado: {e}")
+        print(f"[ERRO] Falha na comunicação com o Arduino: {e}")
+
+# Modo sequencial: lê, detecta e devolve um frame por vez na mesma thread
+def sequential_frames(cap, detect):
+    frame_idx = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            return
+        frame_idx += 1
+        yield frame_idx, frame, detect(frame)
 
 # Função principal de detecção e envio
 def main():
-    refs, orb = load_reference_images(PATH_IMAGES)
+    cache = DescriptorCache(os.path.join(PATH_IMAGES, CACHE_DIRNAME))
+    refs, orb = load_reference_images(PATH_IMAGES, cache=cache)
     if not refs:
         print(f'Nenhuma imagem encontrada em "{PATH_IMAGES}".')
         return
 
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+    index = ReferenceIndex(refs)
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
         print('Não foi possível acessar a câmera.')
         return
 
-    last_name = None
-    consec_count = 0
-    showing = False
-    show_until = 0.0
-    show_text = ''
-    frame_idx = 0
+    # Tudo o que abre threads, processos ou portas é fechado no finally,
+    # mesmo com erro ou Ctrl+C no laço da câmera
+    dispatcher = None
+    pipeline = None
+    pool = None
+    try:
+        last_name = None
+        consec_count = 0
+        showing = False
+        show_until = 0.0
+        show_text = ''
 
-    # Defina o MAC address do EV3
-    mac_address = '00:16:53:82:0E:20'
-    mailbox_name = 'ab'  # Nome do mailbox no EV3
+        # Defina o MAC address do EV3
+        mac_address = '00:16:53:82:0E:20'
+        mailbox_name = 'ab'  # Nome do mailbox no EV3
 
-    # Variável para controlar o tempo de envio de comandos
-    last_sent_time = 0  # Controle global de tempo
-    cooldown_time = 50  # Tempo de cooldown (em segundos) antes de enviar o comando novamente
+        # Já conecta ao EV3 em segundo plano para a primeira detecção não esperar
+        sender.warm(mac_address)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame_idx += 1
+        # Abre a porta do Arduino agora, e não na primeira detecção (espera o reset uma vez só)
+        try:
+            arduino.open()
+        except Exception as e:
+            print(f"[ERRO] Não foi possível abrir a porta do Arduino ({e}); tenta de novo no envio")
+
+        # Atuadores rodando em segundo plano: o laço da câmera nunca espera o envio
+        cooldown_time = 50  # Tempo de cooldown (em segundos) antes de enviar o comando novamente
+        dispatcher = ActuationDispatcher({
+            'ev3': lambda label: enviar_numero_ev3(mac_address, mailbox_name, CLASS_CODES[label]),
+            'arduino': lambda label: enviar_comando_arduino(),
+        }, cooldown=cooldown_time).start()
+
+        # Porta de movimento compartilhada pelas threads de detecção
+        threaded = PROCESS_WORKERS <= 0
+        gate = MotionGate() if MOTION_GATE and threaded else None
+        trackers = []
+
+        # Cada degrau compara o frame com as referências calculadas na mesma
+        # escala e com o mesmo ORB, para a pontuação não cair abaixo de
+        # MIN_DISPLAY_SCORE quando a qualidade baixa
+        def rung_references(rung_orb, scale):
+            rung_refs, _ = load_reference_images(PATH_IMAGES, orb=rung_orb, scale=scale, cache=cache)
+            return ReferenceIndex(rung_refs)
+
+        # Controlador de qualidade compartilhado (o tempo medido é o de todas as threads)
+        controller = None
+        if ADAPTIVE_QUALITY and threaded:
+            controller = QualityController(orb, TARGET_FPS, references=rung_references)
+        cache.prune()
+
+        # Função de detecção: ORB no frame + busca no índice de referências.
+        # Cada thread de detecção recebe a sua, com o seu próprio ORB.
+        def make_detector():
+            if controller is not None:
+                extract = controller.make_extractor(with_index=True)
+            else:
+                frame_orb = clone_orb(orb)
+
+                def extract(gray):
+                    return frame_orb.detectAndCompute(gray, None) + (index,)
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        _, des_frame = orb.detectAndCompute(gray, None)
+            if TRACK_AFTER_DETECT:
+                # Detecção completa que também devolve onde estão os pontos do objeto
+                def detect_full(gray):
+                    kp, des_frame, frame_index = extract(gray)
+                    name, score, matched = frame_index.best_with_points(des_frame, by_class=SCORE_BY_CLASS)
+                    points = np.float32([kp[i].pt for i in matched]).reshape(-1, 2)
+                    return name, score, points
 
-        now = time.time()
+                if controller is not None:
+                    detect_full = controller.wrap(detect_full)
 
-        # Se estivermos exibindo o resultado temporariamente
-        if showing:
-            cv2.putText(frame, show_text, (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            if now >= show_until:
-                showing = False
-                consec_count = 0
-                last_name = None
+                # Um rastreador por thread: o fluxo óptico precisa dos frames em sequência
+                tracker = ObjectTracker(MIN_CONSECUTIVE_FRAMES, MIN_DISPLAY_SCORE, REID_EVERY)
+                trackers.append(tracker)
+                detect = tracker.wrap(detect_full)
+            else:
+                def detect(frame):
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    # O índice vem do degrau de qualidade em que o frame foi descrito
+                    _, des_frame, frame_index = extract(gray)
+                    # Uma única busca contra o índice de todas as referências
+                    if SCORE_BY_CLASS:
+                        return frame_index.best_class(des_frame)
+                    return frame_index.best(des_frame)
+
+                if controller is not None:
+                    detect = controller.wrap(detect)
+
+            if gate is not None:
+                return gate.wrap(detect, empty=('—', 0.0))
+            return detect
+
+        if not threaded:
+            # Detecção em processos separados, resultados na ordem dos frames
+            pool = DetectionPool(refs, orb, workers=PROCESS_WORKERS, by_class=SCORE_BY_CLASS)
+            source = pool.run(cap)
+        elif PIPELINE_WORKERS > 0:
+            # Captura, detecção e exibição em threads separadas
+            pipeline = VisionPipeline(cap, make_detector, workers=PIPELINE_WORKERS).start()
+            source = pipeline.results()
         else:
-            # Detecta melhor match
-            best_score = 0.0
-            best_name = '—'
-            for ref in refs:
-                score, _ = match_and_score(ref['descriptors'], des_frame, bf)
-                if score > best_score:
-                    best_score = score
-                    best_name = ref['name']
-
-            # Mostra no terminal o progresso
-            print(f"[Frame {frame_idx}] {best_name}: {best_score:.1f}% (consec: {consec_count})")
-
-            # Atualiza contador de frames consecutivos
-            if best_score >= MIN_DISPLAY_SCORE and best_name == last_name:
-                consec_count += 1
-            elif best_score >= MIN_DISPLAY_SCORE:
-                consec_count = 1
-                last_name = best_name
+            source = sequential_frames(cap, make_detector())
+
+        for frame_idx, frame, (best_name, best_score) in source:
+            now = time.time()
+
+            # Se estivermos exibindo o resultado temporariamente
+            if showing:
+                cv2.putText(frame, show_text, (10, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+                if now >= show_until:
+                    showing = False
+                    consec_count = 0
+                    last_name = None
             else:
-                consec_count = 0
-                last_name = None
-
-            # Inicia exibição temporizada se atingir o mínimo
-            if consec_count >= MIN_CONSECUTIVE_FRAMES:
-                show_text = f'{best_name}: {best_score:.1f}%'
-                show_until = now + DISPLAY_DURATION
-                showing = True
-
-                # Enviar número para o EV3 baseado no nome do arquivo
-                if now - last_sent_time >= cooldown_time:
-                    if best_name.lower().startswith('quadrado'):
-                        print(f"[ENVIADO] Comando para 'quadrado'")
-                        enviar_numero_ev3(mac_address, mailbox_name, 0)
-                        run_send_arduino_script()  # Rodar o comando para Arduino
-                        last_sent_time = now  # Atualiza o tempo de envio
-
-                    elif best_name.lower().startswith('bala'):
-                        print(f"[ENVIADO] Comando para 'bala'")
-                        enviar_numero_ev3(mac_address, mailbox_name, 1)
-                        run_send_arduino_script()  # Rodar o comando para Arduino
-                        last_sent_time = now  # Atualiza o tempo de envio
-
-                    elif best_name.lower().startswith('peao'):
-                        print(f"[ENVIADO] Comando para 'peao'")
-                        enviar_numero_ev3(mac_address, mailbox_name, 2)
-                        run_send_arduino_script()  # Rodar o comando para Arduino
-                        last_sent_time = now  # Atualiza o tempo de envio
-
-        cv2.imshow('Deteccao de Objetos', frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-    cap.release()
-    cv2.destroyAllWindows()
+                # Mostra no terminal o progresso (e os frames descartados no modo pipeline)
+                dropped = ''
+                if pipeline is not None:
+                    stats = pipeline.stats()
+                    dropped = f", descartados: {stats['dropped_capture'] + stats['dropped_results']}"
+                print(f"[Frame {frame_idx}] {best_name}: {best_score:.1f}% (consec: {consec_count}{dropped})")
+
+                # Atualiza contador de frames consecutivos
+                if best_score >= MIN_DISPLAY_SCORE and best_name == last_name:
+                    consec_count += 1
+                elif best_score >= MIN_DISPLAY_SCORE:
+                    consec_count = 1
+                    last_name = best_name
+                else:
+                    consec_count = 0
+                    last_name = None
+
+                # Inicia exibição temporizada se atingir o mínimo
+                if consec_count >= MIN_CONSECUTIVE_FRAMES:
+                    show_text = f'{best_name}: {best_score:.1f}%'
+                    show_until = now + DISPLAY_DURATION
+                    showing = True
+                    if gate is not None:
+                        # O resultado na tela seria descartado: não roda o ORB até lá
+                        gate.hold(show_until)
+
+                    # Entrega a detecção ao despachante, que envia ao EV3 e ao
+                    # Arduino em segundo plano (cooldown e duplicatas ficam com ele)
+                    label = next((c for c in CLASS_CODES if best_name.lower().startswith(c)), None)
+                    if label is not None:
+                        print(f"[DETECTADO] '{label}' entregue ao despachante")
+                        dispatcher.submit(label)
+
+            cv2.imshow('Deteccao de Objetos', frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+
+        if pipeline is not None:
+            pipeline.stop()
+            stats = pipeline.stats()
+            print(f"[INFO] Frames capturados: {stats['captured']}, processados: {stats['processed']}, "
+                  f"descartados: {stats['dropped_capture']} na captura e {stats['dropped_results']} na exibição")
+        if gate is not None:
+            stats = gate.stats()
+            print(f"[INFO] Porta de movimento: {stats['detected']} de {stats['frames']} frames analisados, "
+                  f"{stats['skipped_static']} pulados com a cena parada e {stats['skipped_hold']} durante a exibição")
+        if trackers:
+            stats = {key: sum(t.stats()[key] for t in trackers) for key in ('full', 'tracked', 'reid', 'lost')}
+            print(f"[INFO] Rastreamento: {stats['tracked']} frames rastreados, {stats['full']} detecções completas "
+                  f"({stats['reid']} reidentificações, {stats['lost']} objetos perdidos)")
+        if controller is not None:
+            settings = controller.settings()
+            print(f"[INFO] Qualidade final: escala {settings['scale']}, nfeatures {settings['nfeatures']}, "
+                  f"nlevels {settings['nlevels']} ({settings['changes']} ajustes para {settings['target_fps']} FPS)")
+    finally:
+        if pipeline is not None:
+            pipeline.stop()
+        if pool is not None:
+            pool.close()
+        cap.release()
+        cv2.destroyAllWindows()
+        if dispatcher is not None:
+            # Não espera o "OK start" da garra (até 60 s): o despachante
+            # termina e só depois a porta e as conexões são fechadas
+            arduino.cancel()
+            dispatcher.stop()
+        sender.close()
+        arduino.close()
 
 if __name__ == "__main__":
     main()
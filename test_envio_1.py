@@ -1,24 +1,17 @@
 import sys
-import bluetooth
-from ev3mailbox import EV3Mailbox
+from ev3sender import EV3Sender
+
+# Conexões Bluetooth mantidas abertas entre envios (reconecta sozinho se cair)
+sender = EV3Sender()
 
 def enviar_numero_ev3(mac_address, mailbox_name, numero, porta=1):
     try:
-        sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-        sock.connect((mac_address, porta))
-        print(f"[OK] Conectado ao EV3: {mac_address}")
-
-        mensagem = EV3Mailbox.encode(mailbox_name, float(numero))  # força float
-        sock.send(mensagem.payload)
+        sender.send(mac_address, mailbox_name, float(numero), port=porta)  # força float
         print(f"[ENVIADO] {mailbox_name} = {numero} (tipo: {type(numero).__name__})")
 
     except Exception as e:
         print(f"[ERRO] Falha ao enviar: {e}")
 
-    finally:
-        sock.close()
-        print("[INFO] Conexão Bluetooth encerrada.")
-
 if __name__ == "__main__":
     if len(sys.argv) != 4:
         print("Uso: python enviar.py <MAC> <mailbox> <numero>")
@@ -29,7 +22,10 @@ if __name__ == "__main__":
     mailbox = sys.argv[2]
     numero = sys.argv[3]
 
-    enviar_numero_ev3(mac, mailbox, numero)
+    try:
+        enviar_numero_ev3(mac, mailbox, numero)
+    finally:
+        sender.close()
 
 
 # python send_mailbox.py 00:16:53:82:0E:20 contador 10
\ No newline at end of file
@@ -1,23 +1,21 @@
 import sys
-import serial
-from ev3mailbox import EV3Mailbox
+from ev3messages import EV3Messages
+from ev3transport import SerialTransport
 
+# Mesmo EV3Messages do Bluetooth (codificação, reconexão, recepção), só que
+# pela porta USB serial
 def enviar_numero_ev3_serial(porta_serial, mailbox_name, numero, baudrate=57600):
+    handler = EV3Messages(transport=SerialTransport(porta_serial, baudrate))
     try:
-        ser = serial.Serial(porta_serial, baudrate, timeout=1)
-        print(f"[OK] Conectado ao EV3 via USB: {porta_serial}")
-
-        mensagem = EV3Mailbox.encode(mailbox_name, float(numero))
-        ser.write(mensagem.payload)
+        handler.send(mailbox_name, float(numero))
         print(f"[ENVIADO] {mailbox_name} = {numero} (tipo: {type(numero).__name__})")
 
     except Exception as e:
         print(f"[ERRO] Falha ao enviar: {e}")
 
     finally:
-        if 'ser' in locals() and ser.is_open:
-            ser.close()
-            print("[INFO] Conexão Serial encerrada.")
+        handler.stop()
+        print("[INFO] Conexão Serial encerrada.")
 
 if __name__ == "__main__":
     if len(sys.argv) != 4:
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# ActuationDispatcher cooldown and duplicate rules, and shutdown
+#
+# Usage: python3 -m pytest tests  (or python3 -m unittest discover tests)
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from actuation import ActuationDispatcher
+
+class DispatcherTest(unittest.TestCase):
+
+    def run_events(self, events, **kwargs):
+        """
+        Pass (label, time) events through a dispatcher and return the labels
+        fired, and its stats
+        """
+        fired      = []
+        dispatcher = ActuationDispatcher({'output': fired.append}, **kwargs)
+        # Times chosen by the test, without waiting for them to pass
+        for event in events:
+            dispatcher.events.put(event)
+        dispatcher.start()
+        dispatcher.stop()
+        return fired, dispatcher.stats()
+
+    def test_dedup_window_counts_from_last_fire(self):
+        # A detection every 0.5 s for 4 s with a 1 s window fires every 1 s
+        events = [('cube', i * 0.5) for i in range(8)]
+        fired, stats = self.run_events(events, dedup_window=1.0)
+        self.assertEqual(fired, ['cube'] * 4)
+        self.assertEqual(stats['duplicate'], 4)
+
+    def test_dedup_is_per_label(self):
+        events = [('cube', 0.0), ('ball', 0.1), ('cube', 0.2), ('ball', 1.2)]
+        fired, _ = self.run_events(events, dedup_window=1.0)
+        self.assertEqual(fired, ['cube', 'ball', 'ball'])
+
+    def test_cooldown_suppressed_event_does_not_start_dedup(self):
+        # The ball at 0.5 s falls in the cooldown, so the one at 2.5 s fires
+        events = [('cube', 0.0), ('ball', 0.5), ('ball', 2.5)]
+        fired, stats = self.run_events(events, cooldown=2.0, dedup_window=5.0)
+        self.assertEqual(fired, ['cube', 'ball'])
+        self.assertEqual(stats['cooldown'], 1)
+
+    def test_stop_waits_for_slow_output(self):
+        finished = threading.Event()
+
+        def slow(label):
+            time.sleep(0.5)
+            finished.set()
+
+        dispatcher = ActuationDispatcher({'slow': slow, 'fast': lambda label: None}).start()
+        dispatcher.submit('cube')
+        time.sleep(0.05)
+        dispatcher.stop()
+        # Nothing may close the slow output's port or link before it's done
+        self.assertTrue(finished.is_set())
+        self.assertFalse(any(thread.is_alive() for thread in dispatcher.threads))
+
+if __name__ == '__main__':
+    unittest.main()
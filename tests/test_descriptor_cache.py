@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# DescriptorCache keys, invalidation and prune
+#
+# Usage: python3 -m pytest tests  (or python3 -m unittest discover tests)
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from descriptor_cache import DescriptorCache, array_to_keypoints
+
+IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'captured_images')
+
+
+@unittest.skipUnless(os.path.isdir(IMAGES), 'needs captured_images')
+class DescriptorCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.image = os.path.join(self.tmp, 'bala.jpg')
+        shutil.copy(os.path.join(IMAGES, 'bala.jpg'), self.image)
+        self.directory = os.path.join(self.tmp, 'cache')
+        self.orb = cv2.ORB_create()
+
+    def cached_files(self):
+        return sorted(f for f in os.listdir(self.directory) if f.endswith('.npy'))
+
+    def test_hit_matches_detect_and_compute(self):
+        DescriptorCache(self.directory).compute(self.image, self.orb)
+        cache = DescriptorCache(self.directory)
+        keypoints, descriptors = cache.compute(self.image, self.orb)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+        kp, des = self.orb.detectAndCompute(cv2.imread(self.image, cv2.IMREAD_GRAYSCALE), None)
+        np.testing.assert_array_equal(descriptors, des)
+        self.assertEqual([k.pt for k in array_to_keypoints(keypoints)],
+                         [tuple(np.float32(k.pt)) for k in kp])
+
+    def test_mtime_change_recomputes(self):
+        DescriptorCache(self.directory).compute(self.image, self.orb)
+        stat = os.stat(self.image)
+        os.utime(self.image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        cache = DescriptorCache(self.directory)
+        cache.compute(self.image, self.orb)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    def test_size_change_recomputes(self):
+        DescriptorCache(self.directory).compute(self.image, self.orb)
+        stat = os.stat(self.image)
+        with open(self.image, 'ab') as f:
+            f.write(b'\0')
+        # Same mtime, so only the size tells them apart
+        os.utime(self.image, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        cache = DescriptorCache(self.directory)
+        cache.compute(self.image, self.orb)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    def test_orb_params_change_recomputes(self):
+        DescriptorCache(self.directory).compute(self.image, self.orb)
+
+        cache = DescriptorCache(self.directory)
+        cache.compute(self.image, cv2.ORB_create(300))
+        cache.compute(self.image, self.orb, scale=0.5)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        cache.compute(self.image, self.orb)
+        self.assertEqual(cache.hits, 1)
+
+    def test_unreadable_image(self):
+        broken = os.path.join(self.tmp, 'broken.jpg')
+        with open(broken, 'wb') as f:
+            f.write(b'not a jpeg')
+        self.assertIsNone(DescriptorCache(self.directory).compute(broken, self.orb))
+
+    def test_prune_keeps_only_used(self):
+        DescriptorCache(self.directory).compute(self.image, self.orb)
+        DescriptorCache(self.directory).compute(self.image, cv2.ORB_create(300))
+        self.assertEqual(len(self.cached_files()), 4)
+
+        cache = DescriptorCache(self.directory)
+        cache.compute(self.image, self.orb)
+        used = self.cached_files()
+        cache.prune()
+        self.assertEqual(len(self.cached_files()), 2)
+        self.assertTrue(set(self.cached_files()) <= set(used))
+        self.assertEqual(cache.hits, 1)
+
+    def test_prune_without_directory(self):
+        DescriptorCache(os.path.join(self.tmp, 'missing')).prune()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# DetectionPool against in-process detection, on captured_images
+#
+# Usage: python3 -m pytest tests  (or python3 -m unittest discover tests)
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from multiprocessing import shared_memory
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from detection_pool import DetectionPool
+from reference_index import ReferenceIndex
+from send_mailbox import load_reference_images
+
+IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'captured_images')
+
+
+class FrameSource():
+    """
+    Stands in for cv2.VideoCapture
+    """
+
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    def read(self):
+        if not self.frames:
+            return False, None
+        return True, self.frames.pop(0)
+
+
+@unittest.skipUnless(os.path.isdir(IMAGES), 'needs captured_images')
+class DetectionPoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cache_dir = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cache_dir)
+        cls.refs, cls.orb = load_reference_images(IMAGES, cache_dir=cache_dir)
+        cls.frames = [cv2.resize(cv2.imread(os.path.join(IMAGES, filename)), (320, 240))
+                      for filename in sorted(os.listdir(IMAGES))
+                      if os.path.isfile(os.path.join(IMAGES, filename))]
+
+        index = ReferenceIndex(cls.refs)
+        cls.expected = [
+            index.best(cls.orb.detectAndCompute(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), None)[1])
+            for frame in cls.frames
+        ]
+
+    def test_run_in_order(self):
+        # Fewer slots than frames, so slots are reused
+        with DetectionPool(self.refs, self.orb, workers=2, slots=3) as pool:
+            results = list(pool.run(FrameSource(self.frames * 2)))
+
+        self.assertEqual([idx for idx, _, _ in results], list(range(1, 2 * len(self.frames) + 1)))
+        self.assertEqual([result for _, _, result in results], self.expected * 2)
+        for (_, frame, _), sent in zip(results, self.frames * 2):
+            self.assertIs(frame, sent)
+
+    def test_results_by_sequence(self):
+        with DetectionPool(self.refs, self.orb, workers=2, slots=len(self.frames)) as pool:
+            seqs = [pool.submit(frame) for frame in self.frames]
+            # Asked for last to first, each still gets its own frame's result
+            results = [pool.result(seq) for seq in reversed(seqs)]
+        self.assertEqual(results[::-1], self.expected)
+
+    def test_frame_must_fit_ring(self):
+        with DetectionPool(self.refs, self.orb, workers=1) as pool:
+            pool.result(pool.submit(self.frames[0]))
+            with self.assertRaises(ValueError):
+                pool.submit(cv2.resize(self.frames[0], (160, 120)))
+
+    def test_close_unlinks_shared_memory(self):
+        pool = DetectionPool(self.refs, self.orb, workers=2)
+        pool.result(pool.submit(self.frames[0]))
+        name      = pool.shm.name
+        processes = list(pool.processes)
+        pool.close()
+
+        self.assertIsNone(pool.shm)
+        self.assertFalse(any(process.is_alive() for process in processes))
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+    def test_close_before_first_frame(self):
+        DetectionPool(self.refs, self.orb, workers=2).close()
+
+
+if __name__ == '__main__':
+    unittest.main()
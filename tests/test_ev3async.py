@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# EV3AsyncMessages against ev3simulator over TCP
+#
+# Usage: python3 -m pytest tests  (or python3 -m unittest discover tests)
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ev3async import EV3AsyncMessages
+from ev3simulator import EV3Simulator
+from ev3transport import SerialTransport, SocketPairTransport
+
+class AsyncMessagesTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.simulator = EV3Simulator()
+        self.address   = self.simulator.listen()
+        self.addCleanup(self.simulator.close)
+
+    async def start(self, **kwargs):
+        handler = EV3AsyncMessages(*self.address, tcp=True, **kwargs)
+        await handler.connect()
+        return handler
+
+    async def fill(self, handler, count):
+        """
+        Have the simulator echo count numbers to 'n' in one write, and wait
+        until the reader has taken them all
+        """
+        await handler.send_many([('n', float(i)) for i in range(count)])
+        while True:
+            stats = handler.stats().get('n')
+            if stats != None and stats['depth'] + stats['dropped'] >= count:
+                return
+            await asyncio.sleep(0.01)
+
+    async def test_close_releases_every_waiter(self):
+        handler = await self.start()
+        waiters = [asyncio.ensure_future(handler.get('n')) for _ in range(2)]
+        waiters.append(asyncio.ensure_future(self.collect(handler.subscribe('n'))))
+        await asyncio.sleep(0.05)
+
+        await handler.close()
+        results = await asyncio.wait_for(asyncio.gather(*waiters), 1)
+        self.assertEqual(results, [None, None, []])
+
+        # And anything after close returns straight away
+        self.assertIsNone(await asyncio.wait_for(handler.get('n'), 1))
+        self.assertIsNone(await asyncio.wait_for(handler.get('other'), 1))
+        self.assertEqual(await asyncio.wait_for(self.collect(handler.subscribe('other')), 1), [])
+
+    async def test_queued_messages_readable_after_close(self):
+        handler = await self.start()
+        await self.fill(handler, 2)
+        await handler.close()
+
+        self.assertEqual((await handler.get('n')).value, 0.0)
+        self.assertEqual((await handler.get('n')).value, 1.0)
+        self.assertIsNone(await handler.get('n'))
+
+    async def test_drop_oldest(self):
+        handler = await self.start(maxlen=3)
+        await self.fill(handler, 10)
+
+        self.assertEqual(handler.stats()['n'], {'depth': 3, 'dropped': 7})
+        self.assertEqual([(await handler.get('n')).value for _ in range(3)], [7.0, 8.0, 9.0])
+        await handler.close()
+
+    async def test_drop_newest(self):
+        handler = await self.start(maxlen=3, policy=EV3AsyncMessages.DROP_NEWEST)
+        await self.fill(handler, 10)
+
+        self.assertEqual(handler.stats()['n'], {'depth': 3, 'dropped': 7})
+        self.assertEqual([(await handler.get('n')).value for _ in range(3)], [0.0, 1.0, 2.0])
+        await handler.close()
+
+    async def test_get_timeout_keeps_later_message(self):
+        handler = await self.start()
+        self.assertIsNone(await handler.get('n', timeout=0.05))
+
+        await handler.send('n', 5.0)
+        self.assertEqual((await handler.get('n', timeout=1)).value, 5.0)
+        await handler.close()
+
+    async def test_socket_pair_transport(self):
+        transport = SocketPairTransport(serve=self.simulator.serve)
+        handler   = EV3AsyncMessages(transport=transport)
+        await handler.send('n', 3.0)
+        self.assertEqual((await handler.get('n', timeout=1)).value, 3.0)
+        await handler.close()
+
+    async def test_serial_transport(self):
+        # pyserial's loop:// echoes what is written, through a LinkStream
+        handler = EV3AsyncMessages(transport=SerialTransport('loop://'))
+        await handler.send_many([('n', 1.0), ('s', 'text')])
+        self.assertEqual((await handler.get('n', timeout=2)).value, 1.0)
+        self.assertEqual((await handler.get('s', timeout=2)).value, 'text')
+        await handler.close()
+
+    async def test_no_reconnect_after_close(self):
+        handler = await self.start()
+        await handler.close()
+        with self.assertRaises(OSError):
+            await handler.send('n', 1.0)
+        with self.assertRaises(OSError):
+            await handler.connect()
+        self.assertIsNone(handler.writer)
+        self.assertEqual(self.simulator.stats()['connections'], 1)
+
+    async def collect(self, subscription):
+        return [msg async for msg in subscription]
+
+if __name__ == '__main__':
+    unittest.main()
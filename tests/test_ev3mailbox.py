@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# EV3Mailbox codec, MailboxView and EV3MailboxFramer
+#
+# Usage: python3 -m pytest tests  (or python3 -m unittest discover tests)
+
+import os
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ev3mailbox import EV3Mailbox, EV3MailboxFramer, MailboxView, TEST_VECTORS
+
+# One of each type
+VALUES = [
+    ('text', 'python', str),
+    ('flag', True, bool),
+    ('number', 3.5, float),
+]
+
+# The buffer types a receive path may hand over
+BUFFERS = [bytes, bytearray, memoryview]
+
+class BufferTypesTest(unittest.TestCase):
+
+    def test_decode_any_buffer(self):
+        for name, value, d_type in VALUES:
+            payload = bytes(EV3Mailbox.encode(name, value).payload)
+            for buffer in BUFFERS:
+                with self.subTest(d_type=d_type.__name__, buffer=buffer.__name__):
+                    mailbox = EV3Mailbox.decode(buffer(payload))
+                    self.assertEqual(mailbox.name, name)
+                    self.assertEqual(mailbox.value, value)
+                    self.assertIs(mailbox.d_type, d_type)
+
+    def test_view_any_buffer(self):
+        for name, value, d_type in VALUES:
+            # Padded on both sides, as a view is usually one of several
+            # messages in a receive buffer
+            payload = bytes(EV3Mailbox.encode(name, value).payload)
+            data    = b'\xff' * 3 + payload + b'\xff' * 2
+            for buffer in BUFFERS:
+                with self.subTest(d_type=d_type.__name__, buffer=buffer.__name__):
+                    view = MailboxView(buffer(data), 3, 3 + len(payload))
+                    self.assertEqual(view.name, name)
+                    self.assertEqual(view.value, value)
+                    self.assertIs(view.d_type, d_type)
+                    self.assertEqual(bytes(view.payload), payload)
+                    self.assertEqual(bytes(view.detach().payload), payload)
+
+class CodecTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for name, value in TEST_VECTORS:
+            with self.subTest(name=name):
+                mailbox = EV3Mailbox.decode(EV3Mailbox.encode(name, value).payload)
+                self.assertEqual(mailbox.name, name)
+                if type(value) in (int, float):
+                    # Some numbers look like 3 char strings until forced
+                    mailbox.force_number()
+                    self.assertAlmostEqual(mailbox.value, value, delta=abs(value) * 1e-6)
+                else:
+                    self.assertEqual(mailbox.value, value)
+
+    def test_encode_many_matches_encode(self):
+        batch   = [(name, value) for name, value in TEST_VECTORS]
+        encoded = b''.join(EV3Mailbox.encode(name, value).payload for name, value in batch)
+        self.assertEqual(bytes(EV3Mailbox.encode_many(batch)), encoded)
+
+class MalformedTest(unittest.TestCase):
+
+    # Size(2) Header(4) NameLen(1) 'abc\0' ValueLen(2) 'xy\0'
+    GOOD = bytes(EV3Mailbox.encode('abc', 'xy').payload)
+
+    def frame(self, offset, replacement):
+        return self.GOOD[:offset] + replacement + self.GOOD[offset + len(replacement):]
+
+    def assertRejected(self, payload, error=BufferError):
+        with self.assertRaises(error):
+            EV3Mailbox.decode(payload)
+        with self.assertRaises(error):
+            MailboxView(payload)
+
+    def test_short(self):
+        self.assertRejected(self.GOOD[:5], struct.error)
+        self.assertRejected(self.GOOD[:-1], struct.error)
+
+    def test_too_small(self):
+        self.assertRejected(b'\x08\x00' + self.GOOD[2:10])
+
+    def test_bad_header(self):
+        self.assertRejected(self.frame(2, b'\x00'))
+
+    def test_zero_name_length(self):
+        self.assertRejected(self.frame(6, b'\x00'))
+        # Consistent sizes otherwise, so only the name length is wrong
+        self.assertRejected(b'\x0a\x00' + EV3Mailbox.headerBytes + b'\x00\x03\x00xy\x00')
+
+    def test_oversized_name_length(self):
+        self.assertRejected(self.frame(6, b'\x28'))
+        self.assertRejected(self.frame(6, b'\x06'))
+
+    def test_missing_null(self):
+        self.assertRejected(self.frame(10, b'x'))
+
+    def test_bad_value_length(self):
+        self.assertRejected(self.frame(11, b'\x09'))
+        self.assertRejected(self.frame(11, b'\x01'))
+
+    def test_text_not_terminated(self):
+        with self.assertRaises(BufferError):
+            EV3Mailbox._decode(self.frame(15, b'z'), str)
+
+    def test_framer_skips_bad_frame(self):
+        framer    = EV3MailboxFramer()
+        mailboxes = framer.feed(self.GOOD + self.frame(6, b'\x00') + self.GOOD)
+        self.assertEqual([m.value for m in mailboxes], ['xy', 'xy'])
+        self.assertEqual(framer.dropped, 1)
+        self.assertIsInstance(framer.error, BufferError)
+
+class FramerTest(unittest.TestCase):
+
+    STREAM = [(name, value) for name, value, _ in VALUES]
+
+    def setUp(self):
+        self.data = bytes(EV3Mailbox.encode_many(self.STREAM))
+
+    def values(self, mailboxes):
+        return [(m.name, m.value) for m in mailboxes]
+
+    def test_several_in_one_recv(self):
+        framer = EV3MailboxFramer()
+        self.assertEqual(self.values(framer.feed(self.data)), self.STREAM)
+        self.assertEqual(len(framer.buffer), 0)
+
+    def test_split_anywhere(self):
+        for cut in range(1, len(self.data)):
+            for feed in ('feed', 'feed_views'):
+                with self.subTest(cut=cut, feed=feed):
+                    framer   = EV3MailboxFramer()
+                    received = getattr(framer, feed)(self.data[:cut])
+                    received += getattr(framer, feed)(self.data[cut:])
+                    self.assertEqual(self.values(received), self.STREAM)
+                    self.assertEqual(framer.dropped, 0)
+
+    def test_byte_at_a_time(self):
+        framer   = EV3MailboxFramer()
+        received = []
+        for i in range(len(self.data)):
+            received += framer.feed_views(self.data[i:i + 1])
+        self.assertEqual(self.values(received), self.STREAM)
+
+    def test_views_outlive_later_feeds(self):
+        # Views point into the received bytes, which must not be reused
+        framer = EV3MailboxFramer()
+        views  = framer.feed_views(self.data[:5])
+        views += framer.feed_views(bytearray(self.data[5:]))
+        framer.feed_views(self.data)
+        self.assertEqual(self.values(views), self.STREAM)
+
+    def test_clear_drops_partial(self):
+        framer = EV3MailboxFramer()
+        framer.feed(self.data[:5])
+        framer.clear()
+        self.assertEqual(self.values(framer.feed(self.data)), self.STREAM)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+
+# EV3Messages mailbox FIFOs, and connection handling against ev3simulator
+# over socket pairs
+#
+# Usage: python3 -m pytest tests  (or python3 -m unittest discover tests)
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ev3mailbox import EV3Mailbox
+from ev3messages import EV3Messages
+from ev3simulator import EV3Simulator
+from ev3transport import SocketPairTransport
+
+class CountingTransport(SocketPairTransport):
+    """
+    Socket pair transport that counts opens, and can make them slow or fail
+    """
+
+    def __init__(self, serve=None, delay=0.0, fail=False):
+        super().__init__(serve)
+        self.delay = delay
+        self.fail  = fail
+        self.opens = 0
+        self.links = []
+        self.lock  = threading.Lock()
+
+    def open(self, timeout):
+        with self.lock:
+            self.opens += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise OSError("unreachable")
+        link = super().open(timeout)
+        self.links.append(link)
+        return link
+
+class MessageTest(unittest.TestCase):
+
+    def fill(self, message, count):
+        for i in range(count):
+            message.add(i)
+
+    def drain(self, message):
+        values = []
+        while message.depth() != 0:
+            values.append(message.get_nowait())
+        return values
+
+    def test_drop_oldest(self):
+        message = EV3Messages.Message('n', 3, EV3Messages.DROP_OLDEST)
+        self.fill(message, 10)
+        self.assertEqual(message.stats(), {'depth': 3, 'max_depth': 3, 'dropped': 7})
+        self.assertEqual(self.drain(message), [7, 8, 9])
+
+    def test_drop_newest(self):
+        message = EV3Messages.Message('n', 3, EV3Messages.DROP_NEWEST)
+        self.fill(message, 10)
+        self.assertEqual(message.stats()['dropped'], 7)
+        self.assertEqual(self.drain(message), [0, 1, 2])
+
+    def test_unbounded(self):
+        message = EV3Messages.Message('n')
+        self.fill(message, 5000)
+        self.assertEqual(message.stats(), {'depth': 5000, 'max_depth': 5000, 'dropped': 0})
+
+    def test_block_waits_for_consumer(self):
+        message = EV3Messages.Message('n', 2, EV3Messages.BLOCK)
+        self.fill(message, 2)
+        producer = threading.Thread(target=message.add, args=(2,))
+        producer.start()
+        producer.join(0.2)
+        self.assertTrue(producer.is_alive())
+
+        self.assertEqual(message.get(1), 0)
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(self.drain(message), [1, 2])
+        self.assertEqual(message.stats()['dropped'], 0)
+
+    def test_close_releases_blocked_producer(self):
+        message = EV3Messages.Message('n', 1, EV3Messages.BLOCK)
+        message.add(0)
+        producer = threading.Thread(target=message.add, args=(1,))
+        producer.start()
+        message.close()
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        # The one that couldn't be queued counts as dropped
+        self.assertEqual(message.stats()['dropped'], 1)
+        self.assertEqual(message.get(), 0)
+        self.assertIsNone(message.get())
+
+    def test_configure_shrink_drops_oldest(self):
+        message = EV3Messages.Message('n')
+        self.fill(message, 5)
+        message.configure(2)
+        self.assertEqual(message.stats()['dropped'], 3)
+        self.assertEqual(self.drain(message), [3, 4])
+
+    def test_configure_checks_arguments(self):
+        message = EV3Messages.Message('n')
+        with self.assertRaises(ValueError):
+            message.configure(0)
+        with self.assertRaises(ValueError):
+            message.configure(5, 'drop_random')
+
+    def test_each_message_goes_to_one_waiting_consumer(self):
+        message  = EV3Messages.Message('n')
+        received = []
+        lock     = threading.Lock()
+
+        def consumer():
+            msg = message.get(5)
+            with lock:
+                received.append(msg)
+
+        consumers = [threading.Thread(target=consumer) for _ in range(8)]
+        for thread in consumers:
+            thread.start()
+        time.sleep(0.1)
+
+        # No consumer may come back empty handed before its timeout
+        for i in range(8):
+            message.add(i)
+        for thread in consumers:
+            thread.join(5)
+        self.assertEqual(sorted(received), list(range(8)))
+
+    def test_get_timeout(self):
+        message = EV3Messages.Message('n')
+        start   = time.monotonic()
+        self.assertIsNone(message.get(0.2))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertFalse(message.closed)
+
+        threading.Timer(0.1, message.add, args=(1,)).start()
+        self.assertEqual(message.get(5), 1)
+
+    def test_close_wakes_every_consumer(self):
+        message   = EV3Messages.Message('n')
+        consumers = [threading.Thread(target=message.get) for _ in range(4)]
+        for thread in consumers:
+            thread.start()
+        time.sleep(0.1)
+
+        message.close()
+        for thread in consumers:
+            thread.join(5)
+        self.assertFalse(any(thread.is_alive() for thread in consumers))
+        self.assertTrue(message.closed)
+
+class ConnectionTest(unittest.TestCase):
+
+    def start(self, transport, **kwargs):
+        handler = EV3Messages(transport=transport, recv_timeout=0.1, **kwargs)
+        self.addCleanup(handler.recv_thread.join, 5)
+        self.addCleanup(handler.stop)
+        return handler
+
+    def setUp(self):
+        self.simulator = EV3Simulator()
+        self.addCleanup(self.simulator.close)
+
+    def test_recovers_after_drop(self):
+        reconnected = []
+        transport   = CountingTransport(self.simulator.serve)
+        handler     = self.start(transport, on_reconnect=reconnected.append)
+        self.assertTrue(handler.wait_connected(5))
+
+        self.simulator.drop()
+        start    = time.monotonic()
+        deadline = start + 2
+        echo     = None
+        while echo == None and time.monotonic() < deadline:
+            try:
+                handler.send('ping', 1.0)
+            except OSError:
+                continue
+            echo = handler.get('ping', 0.05)
+
+        self.assertIsNotNone(echo)
+        self.assertLess(time.monotonic() - start, 0.5)
+        # The sender and the receive thread both saw link 1 fail, but only
+        # one new link was opened
+        self.assertEqual(transport.opens, 2)
+        self.assertEqual(handler.reconnects, 1)
+        self.assertEqual(len(reconnected), 1)
+
+    def test_stale_link_error_keeps_new_link(self):
+        transport = CountingTransport(self.simulator.serve)
+        handler   = self.start(transport)
+        self.assertTrue(handler.wait_connected(5))
+
+        link1 = handler.bt_socket
+        handler.disconnect(link1)
+        handler.connect()
+        link2 = handler.bt_socket
+        self.assertIsNot(link1, link2)
+
+        # A late error on link 1 (e.g. from the receive thread)
+        handler.disconnect(link1)
+        self.assertIs(handler.bt_socket, link2)
+        self.assertEqual(handler.state, EV3Messages.UP)
+        handler.send('ping', 2.0)
+        self.assertEqual(handler.get('ping', 1).value, 2.0)
+        self.assertEqual(transport.opens, 2)
+
+    def test_concurrent_senders_single_connect(self):
+        transport = CountingTransport(self.simulator.serve, delay=0.3)
+        handler   = self.start(transport)
+        time.sleep(0.05)
+        self.assertEqual(handler.state, EV3Messages.CONNECTING)
+
+        errors  = []
+        def sender(i):
+            try:
+                handler.send('ping', float(i))
+            except OSError as e:
+                errors.append(e)
+
+        senders = [threading.Thread(target=sender, args=(i,)) for i in range(5)]
+        for thread in senders:
+            thread.start()
+
+        # The send lock is free while the connect is in progress
+        self.assertTrue(handler.bt_lock.acquire(timeout=0.1))
+        handler.bt_lock.release()
+
+        for thread in senders:
+            thread.join(5)
+        self.assertEqual(errors, [])
+        self.assertEqual(transport.opens, 1)
+
+    def test_senders_fail_fast_in_backoff(self):
+        transport = CountingTransport(fail=True)
+        handler   = self.start(transport, backoff_base=10, backoff_max=10)
+        with handler.state_cond:
+            self.assertTrue(handler.state_cond.wait_for(
+                lambda: handler.state == EV3Messages.BACKOFF, 5
+            ))
+
+        start = time.monotonic()
+        with self.assertRaises(OSError):
+            handler.send('ping', 1.0)
+        with self.assertRaises(OSError):
+            handler.send_many([('ping', 1.0), ('ping', 2.0)])
+        with self.assertRaises(OSError):
+            handler.post('ping', 1.0).result(1)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(transport.opens, 1)
+
+    def test_idle_link_is_reconnected(self):
+        # No serve: the other end stays open and never says anything
+        transport = CountingTransport()
+        handler   = self.start(transport, idle_timeout=0.3)
+        self.assertTrue(handler.wait_connected(5))
+
+        deadline = time.monotonic() + 2
+        while handler.reconnects < 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(handler.reconnects, 1)
+        self.assertEqual(transport.opens, 2)
+
+    def test_busy_link_is_kept(self):
+        transport = CountingTransport(self.simulator.serve)
+        handler   = self.start(transport, idle_timeout=0.3)
+        self.assertTrue(handler.wait_connected(5))
+
+        for i in range(10):
+            handler.send('ping', float(i))
+            self.assertIsNotNone(handler.get('ping', 1))
+            time.sleep(0.1)
+        self.assertEqual(transport.opens, 1)
+
+class SelectTest(unittest.TestCase):
+
+    def setUp(self):
+        simulator = EV3Simulator()
+        self.addCleanup(simulator.close)
+        self.handler = EV3Messages(transport=SocketPairTransport(simulator.serve), recv_timeout=0.1)
+        self.addCleanup(self.handler.recv_thread.join, 5)
+        self.addCleanup(self.handler.stop)
+        self.assertTrue(self.handler.wait_connected(5))
+
+    def echo(self, mailboxes):
+        """
+        Have the simulator echo the (name, value) mailboxes, and wait until
+        they have all been queued
+        """
+        self.handler.send_many(mailboxes)
+        names    = set(name for name, _ in mailboxes)
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            stats = self.handler.stats()
+            if sum(stats[name]['depth'] for name in names if name in stats) >= len(mailboxes):
+                return
+            time.sleep(0.01)
+        self.fail('Echo lost')
+
+    def test_select_names(self):
+        self.echo([('other', 1.0), ('b', 2.0)])
+        name, msg = self.handler.select(['a', 'b'], 1)
+        self.assertEqual((name, msg.value), ('b', 2.0))
+        self.assertEqual(self.handler.select(['a', 'b'], 0.1), (None, None))
+
+    def test_select_wildcard(self):
+        self.echo([('motor', 1.0), ('sensor2', 2.0)])
+        name, msg = self.handler.select(['sensor*'], 1)
+        self.assertEqual((name, msg.value), ('sensor2', 2.0))
+        self.assertEqual(self.handler.select(['sensor?'], 0.1), (None, None))
+        self.assertEqual(self.handler.select(['[lm]otor'], 1)[0], 'motor')
+
+    def test_get_any(self):
+        self.echo([('x', 1.0)])
+        name, msg = self.handler.get_any(1)
+        self.assertEqual((name, msg.value), ('x', 1.0))
+        self.assertEqual(self.handler.get_any(0.1), (None, None))
+
+    def test_select_waits_for_arrival(self):
+        threading.Timer(0.2, self.handler.send, args=('late1', 3.0)).start()
+        start = time.monotonic()
+        name, msg = self.handler.select(['late*'], 5)
+        self.assertEqual((name, msg.value), ('late1', 3.0))
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_busy_mailbox_does_not_starve_others(self):
+        self.echo([('busy', float(i)) for i in range(20)] + [('quiet', 0.0)])
+        names = [self.handler.select(['busy', 'quiet'], 1)[0] for _ in range(3)]
+        self.assertIn('quiet', names)
+
+    def test_stop_releases_select(self):
+        threading.Timer(0.2, self.handler.stop).start()
+        self.assertEqual(self.handler.select(['never'], 5), (None, None))
+
+class RecordingLink():
+    """
+    Wraps a socket, recording each sendall and optionally making it slow
+    """
+
+    def __init__(self, sock, delay):
+        self.sock   = sock
+        self.delay  = delay
+        self.writes = []
+
+    def sendall(self, payload):
+        self.writes.append(bytes(payload))
+        time.sleep(self.delay)
+        self.sock.sendall(payload)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+class RecordingTransport(SocketPairTransport):
+
+    def __init__(self, serve=None, delay=0.0):
+        super().__init__(serve)
+        self.delay = delay
+        self.link  = None
+
+    def open(self, timeout):
+        self.link = RecordingLink(super().open(timeout), self.delay)
+        return self.link
+
+class SendTest(unittest.TestCase):
+
+    def start(self, delay=0.0):
+        simulator = EV3Simulator()
+        self.addCleanup(simulator.close)
+        self.transport = RecordingTransport(simulator.serve, delay)
+        handler = EV3Messages(transport=self.transport, recv_timeout=0.1)
+        self.addCleanup(handler.recv_thread.join, 5)
+        self.addCleanup(handler.stop)
+        self.assertTrue(handler.wait_connected(5))
+        return handler
+
+    def test_send_many_is_one_write(self):
+        handler   = self.start()
+        mailboxes = [('id', 2.0), ('score', 87.5), ('label', 'cube'), ('seen', 1, bool)]
+        handler.send_many(mailboxes)
+
+        self.assertEqual(self.transport.link.writes, [
+            b''.join(EV3Mailbox.encode(*mailbox).payload for mailbox in mailboxes)
+        ])
+        self.assertEqual(handler.get('id', 1).value, 2.0)
+        self.assertEqual(handler.get('score', 1).value, 87.5)
+        self.assertEqual(handler.get('label', 1).value, 'cube')
+        self.assertEqual(handler.get('seen', 1).value, True)
+
+    def test_post(self):
+        handler = self.start()
+        future  = handler.post('n', 4.0)
+        self.assertIsNone(future.result(5))
+        self.assertEqual(handler.get('n', 1).value, 4.0)
+
+    def test_posts_queued_during_a_write_go_out_together(self):
+        handler = self.start(delay=0.3)
+        first   = handler.post('n', 0.0)
+        time.sleep(0.1)
+        futures = [handler.post('n', float(i)) for i in range(1, 6)]
+        for future in [first] + futures:
+            future.result(5)
+
+        self.assertEqual(len(self.transport.link.writes), 2)
+        self.assertEqual([handler.get('n', 1).value for _ in range(6)], [0.0, 1.0, 2.0, 3.0, 4.0, 5.0])
+
+    def test_latest_coalesces(self):
+        handler = self.start(delay=0.3)
+        first   = handler.post('speed', 0.0, latest=True)
+        time.sleep(0.1)
+        # While the first write is slow, ten readings of speed and one other
+        futures = [handler.post('speed', float(i), latest=True) for i in range(1, 11)]
+        other   = handler.post('label', 'cube')
+        self.assertEqual(handler.pending(), 2)
+        self.assertEqual(handler.coalesced, 9)
+
+        for future in [first, other] + futures:
+            self.assertIsNone(future.result(5))
+        self.assertEqual(self.transport.link.writes[1], (
+            EV3Mailbox.encode('speed', 10.0).payload + EV3Mailbox.encode('label', 'cube').payload
+        ))
+        self.assertEqual(handler.get('speed', 1).value, 0.0)
+        self.assertEqual(handler.get('speed', 1).value, 10.0)
+        self.assertIsNone(handler.get('speed', 0.2))
+
+    def test_cancelled_post_is_not_written(self):
+        handler = self.start(delay=0.3)
+        handler.post('n', 0.0)
+        time.sleep(0.1)
+        cancelled = handler.post('n', 1.0)
+        kept      = handler.post('n', 2.0)
+        self.assertTrue(cancelled.cancel())
+        kept.result(5)
+        self.assertEqual(self.transport.link.writes[1], EV3Mailbox.encode('n', 2.0).payload)
+
+    def test_stop_flushes_posted(self):
+        handler = self.start(delay=0.1)
+        futures = [handler.post('n', float(i)) for i in range(3)]
+        handler.stop()
+        with self.assertRaises(OSError):
+            handler.post('n', 9.0)
+        for future in futures:
+            self.assertIsNone(future.result(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
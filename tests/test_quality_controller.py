@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# QualityController rungs relative to the reference ORB
+#
+# Usage: python3 -m pytest tests  (or python3 -m unittest discover tests)
+
+import os
+import sys
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from descriptor_cache import DescriptorCache, orb_params
+from quality_controller import QualityController
+from reference_index import ReferenceIndex
+
+IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'captured_images')
+
+# send_mailbox's MIN_DISPLAY_SCORE
+MIN_DISPLAY_SCORE = 10.0
+
+
+class LevelsTest(unittest.TestCase):
+
+    def test_default_orb_ladder(self):
+        controller = QualityController(cv2.ORB_create())
+        self.assertEqual(controller.levels, (
+            (1.0, 500, 8), (1.0, 350, 8), (0.75, 350, 6), (0.75, 250, 6), (0.5, 250, 4),
+        ))
+
+    def test_top_level_is_reference_orb(self):
+        reference = cv2.ORB_create(1000, 1.3, 10, fastThreshold=15)
+        controller = QualityController(reference)
+        self.assertEqual(orb_params(controller._make_orb(0)), orb_params(reference))
+        # The lighter rungs follow the reference ORB
+        self.assertEqual(controller.levels[-1], (0.5, 500, 5))
+
+    def test_first_level_must_be_reference(self):
+        with self.assertRaises(ValueError):
+            QualityController(cv2.ORB_create(), levels=((1.0, 0.5, 1.0), (0.5, 0.5, 0.5)))
+
+
+@unittest.skipUnless(os.path.isdir(IMAGES), 'no captured_images')
+class RungScoresTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cache = DescriptorCache(tmp.name)
+        self.paths = sorted(os.path.join(IMAGES, f) for f in os.listdir(IMAGES)
+                            if os.path.isfile(os.path.join(IMAGES, f)))
+
+        def references(orb, scale):
+            return ReferenceIndex([{'name': os.path.basename(path),
+                                    'descriptors': cache.compute(path, orb, scale)[1]}
+                                   for path in self.paths])
+
+        self.controller = QualityController(cv2.ORB_create(), references=references)
+
+    def test_positive_stays_above_threshold_on_every_rung(self):
+        # Each image as the camera would see it in other light: a positive
+        scores = {}
+        for level in range(len(self.controller.levels)):
+            self.controller.level = level
+            extract = self.controller.make_extractor(with_index=True)
+            for i, path in enumerate(self.paths):
+                gray = cv2.convertScaleAbs(cv2.imread(path, cv2.IMREAD_GRAYSCALE), alpha=0.9, beta=10)
+                _, des_frame, index = extract(gray)
+                frame_scores = index.scores(des_frame)
+                with self.subTest(level=level, image=os.path.basename(path)):
+                    self.assertEqual(int(np.argmax(frame_scores)), i)
+                    self.assertGreaterEqual(frame_scores[i], MIN_DISPLAY_SCORE)
+                    # Close to its rung 0 score, not a fraction of it
+                    if level == 0:
+                        scores[i] = frame_scores[i]
+                    else:
+                        self.assertGreaterEqual(frame_scores[i], 0.75 * scores[i])
+
+    def test_with_index_needs_references(self):
+        with self.assertRaises(ValueError):
+            QualityController(cv2.ORB_create()).make_extractor(with_index=True)
+
+if __name__ == '__main__':
+    unittest.main()
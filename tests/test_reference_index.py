@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# Vectorised scoring against the original knnMatch loop, on captured_images
+#
+# Usage: python3 -m pytest tests  (or python3 -m unittest discover tests)
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from reference_index import ReferenceIndex, class_name
+from send_mailbox import load_reference_images, match_and_score
+
+IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'captured_images')
+
+
+def legacy_match_and_score(des_ref, des_frame, matcher):
+    """
+    The original per-reference scoring with BFMatcher.knnMatch, copied
+    verbatim from send_mailbox.py; the vectorised code must agree with it
+    """
+    if des_ref is None or des_frame is None or len(des_ref) == 0:
+        return 0.0, 0
+    matches = matcher.knnMatch(des_ref, des_frame, k=2)
+    good = []
+    for pair in matches:
+        if len(pair) < 2:
+            continue
+        m, n = pair
+        if m.distance < 0.75 * n.distance:
+            good.append(m)
+    score = (len(good) / len(des_ref)) * 100
+    return score, len(good)
+
+
+@unittest.skipUnless(os.path.isdir(IMAGES), 'needs captured_images')
+class ScoringTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cache_dir = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cache_dir)
+        cls.refs, cls.orb = load_reference_images(IMAGES, cache_dir=cache_dir)
+        cls.bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+
+        # Each reference as a camera frame, as is and darker, plus frames
+        # with no or a single descriptor
+        cls.frames = []
+        for filename in sorted(os.listdir(IMAGES)):
+            img = cv2.imread(os.path.join(IMAGES, filename), cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                continue
+            img = cv2.resize(img, (640, 480))
+            for frame in (img, cv2.convertScaleAbs(img, alpha=0.6)):
+                cls.frames.append(cls.orb.detectAndCompute(frame, None)[1])
+        cls.frames.append(None)
+        cls.frames.append(cls.frames[0][:1])
+
+    def test_match_and_score_equals_knn_loop(self):
+        for i, des_frame in enumerate(self.frames):
+            for ref in self.refs:
+                with self.subTest(frame=i, ref=ref['name']):
+                    expected = legacy_match_and_score(ref['descriptors'], des_frame, self.bf)
+                    self.assertEqual(match_and_score(ref['descriptors'], des_frame), expected)
+
+    def test_no_reference_descriptors(self):
+        self.assertEqual(match_and_score(None, self.frames[0]), (0.0, 0))
+        self.assertEqual(match_and_score(np.empty((0, 32), np.uint8), self.frames[0]), (0.0, 0))
+
+    def test_index_scores_equal_knn_loop(self):
+        index = ReferenceIndex(self.refs)
+        for i, des_frame in enumerate(self.frames):
+            with self.subTest(frame=i):
+                legacy = [legacy_match_and_score(ref['descriptors'], des_frame, self.bf)
+                          for ref in self.refs]
+                self.assertEqual(index.good_matches(des_frame).tolist(), [good for _, good in legacy])
+                # Same counts; only the rounding of good * 100 / n may differ
+                expected = [score for score, _ in legacy]
+                np.testing.assert_allclose(index.scores(des_frame), expected, rtol=1e-12)
+
+                name, score = index.best(des_frame)
+                if max(expected) > 0:
+                    self.assertAlmostEqual(score, max(expected))
+                    self.assertAlmostEqual(expected[index.names.index(name)], max(expected))
+                else:
+                    self.assertEqual((name, score), ('—', 0.0))
+
+    def test_index_class_scores(self):
+        index = ReferenceIndex(self.refs)
+        des_frame = self.frames[0]
+        scores = index.scores(des_frame)
+        for c, cls_name in enumerate(index.classes):
+            views = [s for name, s in zip(index.names, scores) if class_name(name) == cls_name]
+            self.assertEqual(index.class_scores(scores)[c], max(views))
+
+        # Pooled: good matches of every view over all their descriptors
+        good = index.good_matches(des_frame)
+        for c, cls_name in enumerate(index.classes):
+            views = [i for i, name in enumerate(index.names) if class_name(name) == cls_name]
+            expected = 100.0 * good[views].sum() / index.counts[views].sum()
+            self.assertAlmostEqual(index.pooled_scores(good)[c], expected)
+
+    def test_reference_without_descriptors(self):
+        refs = self.refs[:2] + [{'name': 'vazio', 'descriptors': None}]
+        index = ReferenceIndex(refs)
+        self.assertEqual(index.scores(self.frames[0])[2], 0.0)
+        self.assertEqual(len(index.descriptors), sum(len(ref['descriptors']) for ref in self.refs[:2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# ArduinoDriver against a fake board on a pty
+#
+# Usage: python3 -m pytest tests  (or python3 -m unittest discover tests)
+
+import os
+import sys
+from concurrent.futures import CancelledError
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+try:
+    import pty
+    import tty
+except ImportError:
+    pty = None
+
+from send_arduino import ArduinoDriver
+
+class FakeArduino():
+    """
+    Plays garra/aquivo_para_mover_garra.ino on the master end of a pty:
+    prints the ready line after a delay, answers "start" with a progress
+    line and "OK start", "ping" with "OK ping", and ignores anything else
+    """
+
+    def __init__(self, ready=b'PRONTO', ready_delay=0.2):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port     = os.ttyname(self.slave)
+        self.received = []
+        threading.Thread(target=self._run, args=(ready, ready_delay), daemon=True).start()
+
+    def _run(self, ready, ready_delay):
+        if ready:
+            time.sleep(ready_delay)
+            os.write(self.master, ready + b'\r\n')
+
+        buffer = b''
+        while True:
+            try:
+                data = os.read(self.master, 100)
+            except OSError:
+                return
+            buffer += data
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                line = line.strip().decode()
+                self.received.append(line)
+                if line == 'start':
+                    os.write(self.master, b'1. Pegando\r\nOK start\r\n')
+                elif line == 'ping':
+                    os.write(self.master, b'OK ping\r\n')
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+@unittest.skipIf(pty is None, 'needs a pty')
+class ArduinoDriverTest(unittest.TestCase):
+
+    def start(self, **kwargs):
+        board = kwargs.pop('board', None) or FakeArduino()
+        self.addCleanup(board.close)
+        driver = ArduinoDriver(board.port, **kwargs)
+        self.addCleanup(driver.close)
+        return board, driver
+
+    def test_waits_for_ready_line(self):
+        _, driver = self.start(settle=5.0)
+        start = time.monotonic()
+        driver.open()
+        # Back as soon as PRONTO arrives, not after the whole settle time
+        self.assertLess(time.monotonic() - start, 2.0)
+
+    def test_old_sketch_waits_settle(self):
+        _, driver = self.start(board=FakeArduino(ready=None), settle=0.5)
+        start = time.monotonic()
+        driver.open()
+        self.assertGreaterEqual(time.monotonic() - start, 0.5)
+
+    def test_ack(self):
+        board, driver = self.start()
+        lines = driver.send('start', ack='OK start', ack_timeout=2)
+        self.assertEqual(lines, ['1. Pegando', 'OK start'])
+        self.assertEqual(board.received, ['start'])
+
+    def test_ack_timeout(self):
+        _, driver = self.start()
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            driver.send('unknown', ack='OK unknown', ack_timeout=0.5)
+        self.assertLess(time.monotonic() - start, 2.0)
+        # The port is still usable afterwards
+        self.assertEqual(driver.send('ping', ack='OK ping', ack_timeout=2), ['OK ping'])
+
+    def test_reopens_after_serial_exception(self):
+        board, driver = self.start(settle=0.3)
+        driver.open()
+        lost = driver.ser
+        # Writing to a closed port raises a SerialException
+        lost.close()
+
+        self.assertEqual(driver.send('ping', ack='OK ping', ack_timeout=2), ['OK ping'])
+        self.assertIsNot(driver.ser, lost)
+        self.assertEqual(board.received, ['ping'])
+
+    def test_cancel_ends_ack_wait(self):
+        _, driver = self.start(timeout=0.1)
+        driver.open()
+        future = driver.submit('unknown', ack='OK unknown', ack_timeout=60)
+        time.sleep(0.2)
+
+        start = time.monotonic()
+        driver.cancel()
+        with self.assertRaises(CancelledError):
+            future.result(5)
+        self.assertLess(time.monotonic() - start, 1.0)
+        # Later commands fail at once until close
+        with self.assertRaises(CancelledError):
+            driver.send('ping', ack='OK ping', ack_timeout=2)
+
+        driver.close()
+        self.assertEqual(driver.send('ping', ack='OK ping', ack_timeout=2), ['OK ping'])
+
+    def test_submit(self):
+        _, driver = self.start()
+        futures = [driver.submit('ping', ack='OK ping', ack_timeout=2) for _ in range(3)]
+        self.assertEqual([future.result(5) for future in futures], [['OK ping']] * 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import threading
+import cv2
+import numpy as np
+
+# Parâmetros do fluxo óptico (Lucas-Kanade em pirâmide)
+LK_PARAMS = dict(
+    winSize=(21, 21),
+    maxLevel=3,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03),
+)
+
+
+class ObjectTracker:
+    """
+    Rastreamento depois da detecção: quando o mesmo objeto é reconhecido em
+    confirm_frames detecções completas seguidas (com pontuação >= min_score),
+    os keypoints do frame que casaram com ele passam a ser seguidos com fluxo
+    óptico, que custa bem menos que ORB + busca nas referências. Enquanto o
+    rastreamento vale, o resultado repetido é o da última detecção completa.
+
+    A detecção completa volta a rodar a cada reid_every frames rastreados ou
+    assim que a confiança cai: menos de min_ratio dos pontos iniciais (ou
+    menos de min_points) continuam sendo seguidos. Cada ponto é seguido para
+    a frente e de volta, e só fica se voltar a menos de max_error pixels de
+    onde estava.
+
+    detect_full(gray) recebe o frame já em cinza e deve devolver (nome,
+    pontuação, pontos), com pontos um array N x 2 das posições no frame dos
+    keypoints que casaram.
+
+    O fluxo óptico precisa dos frames em sequência, então cada thread de
+    detecção deve ter o seu próprio rastreador.
+    """
+
+    def __init__(self, confirm_frames=5, min_score=10.0, reid_every=15,
+                 min_ratio=0.5, min_points=8, max_error=1.0):
+        self.confirm_frames = confirm_frames
+        self.min_score = min_score
+        self.reid_every = reid_every
+        self.min_ratio = min_ratio
+        self.min_points = min_points
+        self.max_error = max_error
+
+        self.lock = threading.Lock()
+        self.result = None
+        self.candidate = None
+        self.streak = 0
+        self.prev_gray = None
+        self.points = None
+        self.initial_points = 0
+        self.since_reid = 0
+
+        self.counters = {
+            'full': 0,
+            'tracked': 0,
+            'reid': 0,
+            'lost': 0,
+        }
+
+    @property
+    def tracking(self):
+        return self.points is not None
+
+    def _stop(self):
+        self.points = None
+        self.prev_gray = None
+
+    def _track(self, gray):
+        """
+        Segue os pontos até gray; devolve False se a confiança caiu
+        """
+        if self.prev_gray is None or self.prev_gray.shape != gray.shape:
+            return False
+
+        new, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None, **LK_PARAMS)
+        back, status_back, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, new, None, **LK_PARAMS)
+        error = np.abs(self.points - back).reshape(-1, 2).max(axis=1)
+        keep = (status.ravel() == 1) & (status_back.ravel() == 1) & (error < self.max_error)
+
+        self.points = new[keep].reshape(-1, 1, 2)
+        self.prev_gray = gray
+        remaining = len(self.points)
+        return remaining >= self.min_points and remaining >= self.min_ratio * self.initial_points
+
+    def _full(self, gray, detect_full):
+        name, score, points = detect_full(gray)
+        self.counters['full'] += 1
+
+        if score >= self.min_score and name == self.candidate:
+            self.streak += 1
+        elif score >= self.min_score:
+            self.candidate = name
+            self.streak = 1
+        else:
+            self.candidate = None
+            self.streak = 0
+
+        self._stop()
+        if self.streak >= self.confirm_frames and len(points) >= self.min_points:
+            # Objeto confirmado: passa a seguir os pontos que casaram
+            self.points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+            self.initial_points = len(self.points)
+            self.prev_gray = gray
+            self.since_reid = 0
+
+        self.result = (name, score)
+        return self.result
+
+    def wrap(self, detect_full):
+        """
+        Devolve um detect(frame) -> (nome, pontuação) que rastreia quando
+        pode e chama detect_full quando precisa reidentificar o objeto
+        """
+        def tracked(frame):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            with self.lock:
+                if self.tracking:
+                    if self.since_reid < self.reid_every and self._track(gray):
+                        self.since_reid += 1
+                        self.counters['tracked'] += 1
+                        return self.result
+                    if self.since_reid >= self.reid_every:
+                        self.counters['reid'] += 1
+                    else:
+                        self.counters['lost'] += 1
+                return self._full(gray, detect_full)
+
+        return tracked
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
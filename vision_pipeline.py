@@ -0,0 +1,154 @@
+import queue
+import threading
+
+
+class VisionPipeline:
+    """
+    Pipeline de visão em três estágios ligados por filas limitadas:
+
+    - captura: uma thread lendo a câmera sem parar e guardando só o frame
+      mais novo (frames não pegos a tempo pelo detector são descartados);
+    - detecção: uma ou mais threads workers rodando detect(frame);
+    - exibição/decisão: quem consome results(), normalmente a thread
+      principal (cv2.imshow precisa dela).
+
+    Assim o tempo de leitura da câmera e o da detecção se sobrepõem e o FPS
+    fica limitado pelo estágio mais lento, não pela soma deles.
+
+    make_detector é chamado uma vez por worker e deve devolver a função
+    detect(frame) -> resultado; cada worker tem o seu próprio detector,
+    porque os objetos do OpenCV (ORB) não são seguros entre threads.
+    """
+
+    def __init__(self, cap, make_detector, workers=1, queue_size=2):
+        self.cap = cap
+        self.make_detector = make_detector
+        self.workers = max(1, workers)
+        self.results_queue = queue.Queue(maxsize=max(1, queue_size))
+        self.running = False
+        self.threads = []
+
+        # Slot com o frame mais novo da câmera
+        self.slot_cond = threading.Condition()
+        self.slot = None
+        self.capture_done = False
+
+        # Contadores
+        self.stats_lock = threading.Lock()
+        self.captured = 0
+        self.processed = 0
+        self.dropped_capture = 0
+        self.dropped_results = 0
+        self.last_shown = 0
+        self.workers_done = 0
+
+    def start(self):
+        self.running = True
+        self.threads = [threading.Thread(target=self._capture_thread, daemon=True)]
+        for _ in range(self.workers):
+            self.threads.append(threading.Thread(target=self._detect_thread, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        with self.slot_cond:
+            self.slot_cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=2)
+
+    def stats(self):
+        """
+        Contadores de frames: capturados, processados e descartados em cada fila
+        """
+        with self.stats_lock:
+            return {
+                'captured': self.captured,
+                'processed': self.processed,
+                'dropped_capture': self.dropped_capture,
+                'dropped_results': self.dropped_results,
+            }
+
+    def _capture_thread(self):
+        frame_idx = 0
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            frame_idx += 1
+            with self.slot_cond:
+                if self.slot is not None:
+                    # O detector não pegou o frame anterior a tempo
+                    with self.stats_lock:
+                        self.dropped_capture += 1
+                self.slot = (frame_idx, frame)
+                with self.stats_lock:
+                    self.captured += 1
+                self.slot_cond.notify()
+
+        with self.slot_cond:
+            self.capture_done = True
+            self.slot_cond.notify_all()
+
+    def _next_frame(self):
+        with self.slot_cond:
+            while self.slot is None:
+                if self.capture_done or not self.running:
+                    return None
+                self.slot_cond.wait()
+            item = self.slot
+            self.slot = None
+            return item
+
+    def _detect_thread(self):
+        detect = self.make_detector()
+        while True:
+            item = self._next_frame()
+            if item is None:
+                break
+            frame_idx, frame = item
+            result = detect(frame)
+            with self.stats_lock:
+                self.processed += 1
+            self._put((frame_idx, frame, result))
+
+        with self.stats_lock:
+            self.workers_done += 1
+            last = self.workers_done == self.workers
+        if last:
+            self._put(None)
+
+    def _put(self, item):
+        # Fila cheia: descarta o resultado mais antigo para não atrasar a tela
+        while True:
+            try:
+                self.results_queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.results_queue.get_nowait()
+                    with self.stats_lock:
+                        self.dropped_results += 1
+                except queue.Empty:
+                    pass
+
+    def results(self):
+        """
+        Gera (frame_idx, frame, resultado) em ordem de frame até a câmera
+        acabar ou stop() ser chamado. Com vários workers, um resultado que
+        chegue depois de um frame mais novo já exibido é descartado.
+        """
+        while self.running:
+            try:
+                item = self.results_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            if item[0] < self.last_shown:
+                with self.stats_lock:
+                    self.dropped_results += 1
+                continue
+            self.last_shown = item[0]
+            yield item